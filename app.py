@@ -1,14 +1,23 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import json
+import logging
+import math
 import random
 import os
 import base64
 from datetime import datetime, timedelta
 import time
 import re
-from io import BytesIO
+from io import BytesIO, StringIO
 import sqlite3
+import csv
+import threading
+import hashlib
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 # Page configuration
 st.set_page_config(
@@ -93,10 +102,50 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Storage configuration
+DATA_DIR = os.environ.get('CRE8LEARN_DATA_DIR', '.')
+STORAGE_BACKEND = os.environ.get('CRE8LEARN_STORAGE', 'single')  # 'single' or 'sharded'
+SHARD_COUNT = int(os.environ.get('CRE8LEARN_SHARDS', '4'))
+CAMPUSES = [c.strip() for c in os.environ.get('CRE8LEARN_CAMPUSES', 'Maseru').split(',') if c.strip()]
+DEFAULT_CAMPUS = CAMPUSES[0]
+
+# Tables whose writes are recorded in the change feed, with their row key column
+CHANGE_FEED_TABLES = {
+    'students': 'student_id',
+    'course_materials': 'id',
+    'quizzes': 'quiz_id',
+    'quiz_results': 'id',
+}
+REFERENCE_TABLES = ('course_materials', 'quizzes', 'course_fees')
+# History kept by ChangeFeed.compact() while no consumer is registered
+CHANGE_FEED_RETENTION_DAYS = int(os.environ.get('CRE8LEARN_CHANGE_RETENTION_DAYS', '7'))
+FEE_DUE_DAYS = 30
+logger = logging.getLogger(__name__)
+WRITE_LOCK_TIMEOUT = 30
+
+# Exam day: how early scheduled quizzes are prewarmed, and how many quiz starts
+# one server process handles at once before queueing the rest
+EXAM_PREWARM_MINUTES = int(os.environ.get('CRE8LEARN_EXAM_PREWARM_MINUTES', '10'))
+EXAM_MAX_CONCURRENT_STARTS = int(os.environ.get('CRE8LEARN_EXAM_MAX_STARTS', '20'))
+EXAM_SUBMIT_GRACE_SECONDS = 60
+JOB_WORKERS = int(os.environ.get('CRE8LEARN_JOB_WORKERS', '2'))
+# Student exports are written under DATA_DIR/exports and deleted after this many days
+EXPORT_RETENTION_DAYS = int(os.environ.get('CRE8LEARN_EXPORT_RETENTION_DAYS', '7'))
+
+def ensure_column(cursor, table, column, definition):
+    # CREATE TABLE IF NOT EXISTS does not add new columns to existing databases
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
 # Initialize SQLite Database
-def init_database():
-    conn = sqlite3.connect('cre8learn.db', check_same_thread=False)
+def init_database(path=None):
+    if path is None:
+        path = os.path.join(DATA_DIR, 'cre8learn.db')
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
     cursor = conn.cursor()
+    # WAL lets readers (including cross-shard lookups) proceed while another connection writes
+    cursor.execute("PRAGMA journal_mode=WAL")
     
     # Students table
     cursor.execute('''
@@ -169,21 +218,488 @@ def init_database():
             verified BOOLEAN DEFAULT FALSE
         )
     ''')
+
+    ensure_column(cursor, 'students', 'campus', f"TEXT NOT NULL DEFAULT '{DEFAULT_CAMPUS}'")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_quiz_results_quiz ON quiz_results (quiz_id, id)")
+    # Term archiving finds and moves closed-term rows by date
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_quiz_results_completed ON quiz_results (completed_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_inactive_registration ON students (registration_date) WHERE status != 'Active'")
+    
+    # Exam windows: a scheduled quiz is only available between opens_at and closes_at
+    ensure_column(cursor, 'quizzes', 'opens_at', "TEXT")
+    ensure_column(cursor, 'quizzes', 'closes_at', "TEXT")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS exam_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            quiz_id TEXT NOT NULL,
+            student_id TEXT NOT NULL,
+            event TEXT NOT NULL,
+            latency_ms REAL NOT NULL,
+            queued_ms REAL NOT NULL DEFAULT 0,
+            recorded_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_exam_events_quiz ON exam_events (quiz_id, event)")
     
+    # Background jobs: heavy admin actions run outside the Streamlit rerun
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            idempotency_key TEXT UNIQUE NOT NULL,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            result TEXT,
+            error TEXT,
+            worker INTEGER,
+            created_date TEXT NOT NULL,
+            started_date TEXT,
+            finished_date TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, job_id)")
+    
+    # Change feed: append-only log filled by triggers, read by downstream consumers
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            op TEXT NOT NULL,
+            row_key TEXT NOT NULL,
+            changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_changes_row ON changes (table_name, row_key, seq)")
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_consumers (
+            consumer TEXT PRIMARY KEY,
+            last_seq INTEGER NOT NULL DEFAULT 0,
+            updated_date TEXT
+        )
+    ''')
+    
+    for table, key in CHANGE_FEED_TABLES.items():
+        for op, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_{op.lower()}_changes
+                AFTER {op} ON {table}
+                BEGIN
+                    INSERT INTO changes (table_name, op, row_key) VALUES ('{table}', '{op.lower()}', {row}.{key});
+                END
+            ''')
+    
+    # Fees: per-course fee (reference table), per-enrollment balance and payments ledger
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS course_fees (
+            course TEXT PRIMARY KEY,
+            amount REAL NOT NULL,
+            updated_date TEXT NOT NULL
+        )
+    ''')
+    
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'fee_balances'")
+    backfill_balances = cursor.fetchone() is None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fee_balances (
+            student_id TEXT NOT NULL,
+            course TEXT NOT NULL,
+            amount_due REAL NOT NULL DEFAULT 0,
+            amount_paid REAL NOT NULL DEFAULT 0,
+            balance REAL NOT NULL DEFAULT 0,
+            due_date TEXT NOT NULL,
+            last_payment_date TEXT,
+            legacy_paid BOOLEAN DEFAULT FALSE,
+            PRIMARY KEY (student_id, course)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fee_balances_course ON fee_balances (course, balance)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fee_balances_outstanding ON fee_balances (due_date, balance) WHERE balance > 0")
+    if backfill_balances:
+        # One enrollment row per course already on a student; enrollments marked
+        # paid in the old fees_paid map are never charged when a fee is set
+        cursor.execute('''
+            INSERT OR IGNORE INTO fee_balances (student_id, course, due_date, legacy_paid)
+            SELECT s.student_id, c.value, date(s.registration_date, ?),
+                   COALESCE(json_extract(s.fees_paid, '$."' || c.value || '"'), 0)
+            FROM students s, json_each(s.courses) c
+        ''', (f'+{FEE_DUE_DAYS} days',))
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id TEXT NOT NULL,
+            course TEXT NOT NULL,
+            amount REAL NOT NULL,
+            paid_date TEXT NOT NULL,
+            reference TEXT UNIQUE,
+            method TEXT,
+            recorded_date TEXT NOT NULL,
+            FOREIGN KEY (student_id, course) REFERENCES fee_balances (student_id, course)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_course_date ON payments (course, paid_date, amount)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_student ON payments (student_id, course)")
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS payments_apply_balance
+        AFTER INSERT ON payments
+        BEGIN
+            UPDATE fee_balances SET
+                amount_paid = amount_paid + NEW.amount,
+                balance = balance - NEW.amount,
+                last_payment_date = MAX(COALESCE(last_payment_date, ''), NEW.paid_date)
+            WHERE student_id = NEW.student_id AND course = NEW.course;
+            UPDATE students SET fees_paid = json_set(fees_paid, '$."' || NEW.course || '"', json('true'))
+            WHERE student_id = NEW.student_id AND EXISTS (
+                SELECT 1 FROM fee_balances
+                WHERE student_id = NEW.student_id AND course = NEW.course AND balance <= 0
+            );
+        END
+    ''')
+
     conn.commit()
     return conn
 
+class UnitOfWork:
+    # Groups manager writes into one transaction per connection. The outermost
+    # block commits every connection it touched (or rolls all of them back on
+    # error); nested blocks are savepoints, so a failing inner block only undoes
+    # its own writes. Commits to several shard files are not atomic together.
+    def __init__(self, storage):
+        self.storage = storage
+        self.connections = []
+        self.locks = []
+        self.depth = 0
+        self.commits = 0
+    
+    def join(self, conn):
+        # Cursor on conn inside this unit of work. The first join takes the
+        # connection's write lock (writers on other shards are not blocked) and
+        # opens an IMMEDIATE transaction, so other processes wait for the shard
+        # too and reads made through the cursor stay current until commit.
+        # Multi-shard writers join in shard order; a join against that order
+        # gives up after the busy timeout instead of deadlocking.
+        if not any(joined is conn for joined in self.connections):
+            index = self.storage.connection_index(conn)
+            lock = self.storage.write_locks[index]
+            if self.locks and index < max(held for held, _ in self.locks):
+                if not lock.acquire(timeout=WRITE_LOCK_TIMEOUT):
+                    raise sqlite3.OperationalError("database is locked")
+            else:
+                lock.acquire()
+            self.locks.append((index, lock))
+            self.connections.append(conn)
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            for level in range(2, self.depth + 1):
+                conn.execute(f"SAVEPOINT uow_{level}")
+        return conn.cursor()
+    
+    def _enter(self):
+        self.depth += 1
+        if self.depth > 1:
+            for conn in self.connections:
+                conn.execute(f"SAVEPOINT uow_{self.depth}")
+    
+    def _exit(self, failed):
+        try:
+            if self.depth > 1:
+                for conn in self.connections:
+                    if failed:
+                        conn.execute(f"ROLLBACK TO uow_{self.depth}")
+                    conn.execute(f"RELEASE uow_{self.depth}")
+            elif failed:
+                for conn in self.connections:
+                    conn.rollback()
+            else:
+                for conn in self.connections:
+                    conn.commit()
+                    self.commits += 1
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                for _, lock in self.locks:
+                    lock.release()
+                self.locks = []
+                self.connections = []
+
+class UnitOfWorkMixin:
+    # Manager write methods run inside storage.unit_of_work(); called on their
+    # own they commit immediately, inside a caller's block they join it. The
+    # block is per thread (one per Streamlit session) and holds the write lock
+    # of each connection it joined, so sessions sharing a connection never
+    # commit each other's half-done work.
+    def connection_index(self, conn):
+        return next(index for index, candidate in enumerate(self.connections()) if candidate is conn)
+    
+    @contextmanager
+    def unit_of_work(self):
+        uow = getattr(self.local, 'uow', None)
+        if uow is None:
+            uow = self.local.uow = UnitOfWork(self)
+        uow._enter()
+        try:
+            yield uow
+        except BaseException:
+            uow._exit(failed=True)
+            raise
+        else:
+            uow._exit(failed=False)
+        finally:
+            if uow.depth == 0:
+                self.local.uow = None
+
+class SingleFileStorage(UnitOfWorkMixin):
+    # Everything in one cre8learn.db file behind a single writer lock
+    def __init__(self, path=None):
+        self.conn = init_database(path)
+        self.num_shards = 1
+        self.primary = self.conn
+        self.write_locks = [threading.Lock()]
+        self.local = threading.local()
+
+    def connections(self):
+        return [self.conn]
+
+    def map_shards(self, fn):
+        return [fn(self.conn)]
+
+    def shard_index(self, campus):
+        return 0
+
+    def conn_for_campus(self, campus):
+        return self.conn
+
+    def conn_for_student(self, student_id):
+        return self.conn
+
+    def conn_for_email(self, email):
+        return self.conn
+
+    def claim_email(self, uow, email, shard):
+        # The UNIQUE constraint on students.email covers the single file
+        pass
+
+    def align_student_number(self, number, shard):
+        return number
+
+class ShardedStorage(UnitOfWorkMixin):
+    # Student-owned rows (students, quiz_results, email_verification) are
+    # partitioned across shard files by campus. Reference tables (quizzes,
+    # course_materials) are replicated to every shard so per-shard JOINs work.
+    # The routing catalog maps campus -> shard; a student's shard is encoded in
+    # the student number (number % num_shards). Emails are indexed by hash in
+    # an email_index table spread over the shards, which keeps them unique
+    # across shards without a global writer.
+    def __init__(self, num_shards=SHARD_COUNT, data_dir=None):
+        data_dir = data_dir or DATA_DIR
+        self.num_shards = num_shards
+        self.shards = [
+            init_database(os.path.join(data_dir, f'cre8learn_shard{i}.db'))
+            for i in range(num_shards)
+        ]
+        self.primary = self.shards[0]
+        self.catalog = sqlite3.connect(os.path.join(data_dir, 'cre8learn_catalog.db'), check_same_thread=False, timeout=30)
+        self.catalog_lock = threading.Lock()
+        self.campus_shards = {}
+        self._pool = ThreadPoolExecutor(max_workers=num_shards, thread_name_prefix='shard-read')
+        self.write_locks = [threading.Lock() for _ in self.shards]
+        self.local = threading.local()
+        self._init_catalog()
+        self._init_email_index()
+
+    def _init_catalog(self):
+        cursor = self.catalog.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS shard_config (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS shard_catalog (
+                shard_key TEXT PRIMARY KEY,
+                shard INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO shard_config (name, value) VALUES ('num_shards', ?)", (str(self.num_shards),))
+        cursor.execute("SELECT value FROM shard_config WHERE name = 'num_shards'")
+        configured = int(cursor.fetchone()[0])
+        if configured != self.num_shards:
+            raise ValueError(f"Catalog was created with {configured} shards, not {self.num_shards}")
+        cursor.execute("SELECT shard_key, shard FROM shard_catalog")
+        self.campus_shards = dict(cursor.fetchall())
+        self.catalog.commit()
+
+    def _init_email_index(self):
+        # email -> shard of the student, stored on the shard the email hashes to
+        created = []
+        for conn in self.shards:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'email_index'")
+            if cursor.fetchone() is None:
+                cursor.execute('''
+                    CREATE TABLE email_index (
+                        email TEXT PRIMARY KEY,
+                        shard INTEGER NOT NULL
+                    )
+                ''')
+                created.append(conn)
+        for shard, conn in enumerate(self.shards):
+            for (email,) in conn.execute("SELECT email FROM students").fetchall():
+                index = self.shards[self.email_shard(email)]
+                if index in created:
+                    index.execute("INSERT OR IGNORE INTO email_index (email, shard) VALUES (?, ?)", (email, shard))
+        for conn in created:
+            conn.commit()
+
+    def connections(self):
+        return list(self.shards)
+
+    def map_shards(self, fn):
+        # Cross-shard reads for admin views run on all shards concurrently
+        return list(self._pool.map(fn, self.shards))
+
+    def shard_index(self, campus):
+        if campus not in self.campus_shards:
+            with self.catalog_lock:
+                cursor = self.catalog.cursor()
+                cursor.execute("SELECT COUNT(*) FROM shard_catalog")
+                shard = cursor.fetchone()[0] % self.num_shards
+                cursor.execute("INSERT OR IGNORE INTO shard_catalog (shard_key, shard) VALUES (?, ?)", (campus, shard))
+                self.catalog.commit()
+                cursor.execute("SELECT shard FROM shard_catalog WHERE shard_key = ?", (campus,))
+                self.campus_shards[campus] = cursor.fetchone()[0]
+        return self.campus_shards[campus]
+
+    def conn_for_campus(self, campus):
+        return self.shards[self.shard_index(campus)]
+
+    def conn_for_student(self, student_id):
+        try:
+            return self.shards[int(student_id[2:]) % self.num_shards]
+        except (TypeError, ValueError):
+            return self.primary
+
+    def email_shard(self, email):
+        # Stable across processes, unlike hash()
+        return int(hashlib.sha256(email.encode()).hexdigest(), 16) % self.num_shards
+
+    def conn_for_email(self, email):
+        cursor = self.shards[self.email_shard(email)].cursor()
+        cursor.execute("SELECT shard FROM email_index WHERE email = ?", (email,))
+        row = cursor.fetchone()
+        return self.shards[row[0]] if row else self.primary
+
+    def claim_email(self, uow, email, shard):
+        # Records email -> shard in the unit of work that inserts the student,
+        # so the email_index primary key settles concurrent registrations and a
+        # rollback frees the email. Both shards are joined in shard order. An
+        # entry whose student is gone (archived, or its shard commit was lost)
+        # is taken over; the student's shard is joined first so an in-flight
+        # registration finishes before it is checked.
+        index_shard = self.email_shard(email)
+        for index in sorted({shard, index_shard}):
+            uow.join(self.shards[index])
+        cursor = uow.join(self.shards[index_shard])
+        try:
+            cursor.execute("INSERT INTO email_index (email, shard) VALUES (?, ?)", (email, shard))
+        except sqlite3.IntegrityError:
+            cursor.execute("SELECT shard FROM email_index WHERE email = ?", (email,))
+            claimed = uow.join(self.shards[cursor.fetchone()[0]])
+            claimed.execute("SELECT 1 FROM students WHERE email = ?", (email,))
+            if claimed.fetchone():
+                raise sqlite3.IntegrityError("UNIQUE constraint failed: students.email") from None
+            cursor.execute("UPDATE email_index SET shard = ? WHERE email = ?", (shard, email))
+
+    def align_student_number(self, number, shard):
+        number -= (number - shard) % self.num_shards
+        if number < 100000:
+            number += self.num_shards
+        return number
+
+def create_storage(backend=None):
+    backend = backend or STORAGE_BACKEND
+    if backend == 'sharded':
+        return ShardedStorage()
+    if backend == 'single':
+        return SingleFileStorage()
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+# Streamlit re-executes this script on every rerun; cache the storage (and its
+# connections) once per process and configuration
+@st.cache_resource
+def get_storage(backend, data_dir):
+    return create_storage(backend)
+
 # Initialize database
-DB_CONN = init_database()
+STORAGE = get_storage(STORAGE_BACKEND, DATA_DIR)
+DB_CONN = STORAGE.primary
+
+class RecordMixin:
+    # Manager rows are namedtuples (no per-row dict of repeated keys) that still
+    # support the record['field'] and record.get('field') access used by the pages
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._fields else default
+
+STUDENT_COLUMNS = ('student_id', 'name', 'age', 'email', 'phone', 'courses', 'registration_date',
+                   'status', 'grades', 'progress', 'fees_paid', 'email_verified', 'campus')
+MATERIAL_COLUMNS = ('id', 'course_name', 'title', 'description', 'file_name', 'file_content',
+                    'file_type', 'upload_date', 'uploaded_by')
+QUIZ_COLUMNS = ('quiz_id', 'title', 'course', 'duration', 'questions', 'created_date', 'is_active',
+                'opens_at', 'closes_at')
+RESULT_COLUMNS = ('quiz_id', 'student_id', 'score', 'total_questions', 'percentage',
+                  'completed_date', 'quiz_title', 'course')
+
+class StudentRecord(RecordMixin, namedtuple('StudentRecord', STUDENT_COLUMNS)):
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row[0], row[1], row[2], row[3], row[4], json.loads(row[5]), row[6], row[7],
+                   json.loads(row[8]), json.loads(row[9]), json.loads(row[10]), bool(row[11]), row[12])
+
+class MaterialRecord(RecordMixin, namedtuple('MaterialRecord', MATERIAL_COLUMNS)):
+    __slots__ = ()
+
+class QuizRecord(RecordMixin, namedtuple('QuizRecord', QUIZ_COLUMNS)):
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row[0], row[1], row[2], row[3], json.loads(row[4]), row[5], bool(row[6]), row[7], row[8])
+    
+    def is_open(self, now=None):
+        now = (now or datetime.now()).isoformat()
+        return (self.is_active and (self.opens_at is None or self.opens_at <= now)
+                and (self.closes_at is None or self.closes_at > now))
+
+class ResultRecord(RecordMixin, namedtuple('ResultRecord', RESULT_COLUMNS)):
+    __slots__ = ()
+
+def frame_from_cursor(cursor):
+    # Columnar result mode: build the DataFrame straight from the cursor rows
+    return pd.DataFrame.from_records(cursor.fetchall(), columns=[d[0] for d in cursor.description])
 
 class StudentManager:
-    def __init__(self):
-        self.conn = DB_CONN
-        
-    def generate_student_id(self):
+    def __init__(self, storage=None):
+        self.storage = storage or STORAGE
+        self.conn = self.storage.primary
+
+    def generate_student_id(self, campus=None):
+        shard = self.storage.shard_index(campus or DEFAULT_CAMPUS)
         while True:
-            new_id = f"CL{random.randint(100000, 999999)}"
-            cursor = self.conn.cursor()
+            new_id = f"CL{self.storage.align_student_number(random.randint(100000, 999999), shard)}"
+            cursor = self.storage.conn_for_student(new_id).cursor()
             cursor.execute("SELECT student_id FROM students WHERE student_id = ?", (new_id,))
             if not cursor.fetchone():
                 return new_id
@@ -207,16 +723,17 @@ class StudentManager:
         return True
     
     def save_verification_code(self, email, code):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO email_verification 
-            (email, verification_code, created_date, verified)
-            VALUES (?, ?, ?, ?)
-        ''', (email, code, datetime.now().isoformat(), False))
-        self.conn.commit()
+        with self.storage.unit_of_work() as uow:
+            cursor = uow.join(self.storage.conn_for_email(email))
+            cursor.execute('''
+                INSERT OR REPLACE INTO email_verification 
+                (email, verification_code, created_date, verified)
+                VALUES (?, ?, ?, ?)
+            ''', (email, code, datetime.now().isoformat(), False))
     
     def verify_email_code(self, email, code):
-        cursor = self.conn.cursor()
+        conn = self.storage.conn_for_email(email)
+        cursor = conn.cursor()
         cursor.execute('''
             SELECT verification_code, created_date FROM email_verification 
             WHERE email = ? AND verified = FALSE
@@ -228,237 +745,1141 @@ class StudentManager:
             time_diff = datetime.now() - datetime.fromisoformat(created_date)
             if time_diff.total_seconds() < 600:  # 10 minutes
                 if stored_code == code:
-                    cursor.execute('''
-                        UPDATE email_verification SET verified = TRUE WHERE email = ?
-                    ''', (email,))
-                    cursor.execute('''
-                        UPDATE students SET email_verified = TRUE WHERE email = ?
-                    ''', (email,))
-                    self.conn.commit()
+                    with self.storage.unit_of_work() as uow:
+                        cursor = uow.join(conn)
+                        cursor.execute('''
+                            UPDATE email_verification SET verified = TRUE WHERE email = ?
+                        ''', (email,))
+                        cursor.execute('''
+                            UPDATE students SET email_verified = TRUE WHERE email = ?
+                        ''', (email,))
                     return True
         return False
     
-    def add_student(self, name, age, email, phone, courses):
-        student_id = self.generate_student_id()
-        cursor = self.conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO students 
-            (student_id, name, age, email, phone, courses, registration_date, status, grades, progress, fees_paid, email_verified)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            student_id, name, age, email, phone, 
-            json.dumps(courses),
-            datetime.now().isoformat(),
-            'Active',
-            json.dumps({course: 'Not Assessed' for course in courses}),
-            json.dumps({course: '0%' for course in courses}),
-            json.dumps({course: False for course in courses}),
-            False
-        ))
-        self.conn.commit()
+    def add_student(self, name, age, email, phone, courses, campus=None):
+        campus = campus or DEFAULT_CAMPUS
+        with self.storage.unit_of_work() as uow:
+            student_id = self.generate_student_id(campus)
+            conn = self.storage.conn_for_student(student_id)
+            # The UNIQUE constraint on email only holds within one shard
+            self.storage.claim_email(uow, email, self.storage.connection_index(conn))
+            cursor = uow.join(conn)
+            
+            cursor.execute('''
+                INSERT INTO students 
+                (student_id, name, age, email, phone, courses, registration_date, status, grades, progress, fees_paid, email_verified, campus)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                student_id, name, age, email, phone, 
+                json.dumps(courses),
+                datetime.now().isoformat(),
+                'Active',
+                json.dumps({course: 'Not Assessed' for course in courses}),
+                json.dumps({course: '0%' for course in courses}),
+                json.dumps({course: False for course in courses}),
+                False,
+                campus
+            ))
+            self._open_fee_balances(cursor, student_id, courses)
         return student_id
     
-    def get_students(self):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM students")
-        students = []
-        for row in cursor.fetchall():
-            student = {
-                'student_id': row[0],
-                'name': row[1],
-                'age': row[2],
-                'email': row[3],
-                'phone': row[4],
-                'courses': json.loads(row[5]),
-                'registration_date': row[6],
-                'status': row[7],
-                'grades': json.loads(row[8]),
-                'progress': json.loads(row[9]),
-                'fees_paid': json.loads(row[10]),
-                'email_verified': bool(row[11])
-            }
-            students.append(student)
-        return students
-    
-    def search_student(self, student_id):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM students WHERE student_id = ?", (student_id,))
+    def mark_email_verified(self, student_id):
+        with self.storage.unit_of_work() as uow:
+            cursor = uow.join(self.storage.conn_for_student(student_id))
+            cursor.execute("UPDATE students SET email_verified = TRUE WHERE student_id = ?", (student_id,))
+            return cursor.rowcount > 0
+    
+    def _open_fee_balances(self, cursor, student_id, courses):
+        # One balance row per enrollment, charged the course's current fee
+        due_date = (datetime.now() + timedelta(days=FEE_DUE_DAYS)).date().isoformat()
+        cursor.executemany('''
+            INSERT OR IGNORE INTO fee_balances (student_id, course, amount_due, balance, due_date)
+            SELECT ?, ?, COALESCE(MAX(amount), 0), COALESCE(MAX(amount), 0), ?
+            FROM course_fees WHERE course = ?
+        ''', [(student_id, course, due_date, course) for course in courses])
+    
+    def get_students(self, as_frame=False, include_archived=False):
+        # Only hot (non-archived) students unless archived ones are requested
+        query = f"SELECT {', '.join(STUDENT_COLUMNS)} FROM students"
+        if as_frame:
+            # JSON columns (courses, grades, progress, fees_paid) stay encoded in frame mode
+            frames = self.storage.map_shards(lambda conn: frame_from_cursor(conn.execute(query)))
+            if include_archived:
+                frames.append(pd.DataFrame.from_records(self._archived_student_rows(query), columns=STUDENT_COLUMNS))
+            students = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+            students['email_verified'] = students['email_verified'].astype(bool)
+            return students
+        
+        shard_rows = self.storage.map_shards(lambda conn: conn.execute(query).fetchall())
+        if include_archived:
+            shard_rows.append(self._archived_student_rows(query))
+        return [StudentRecord.from_row(row) for rows in shard_rows for row in rows]
+    
+    def _archived_student_rows(self, query):
+        archiver = TermArchiver(self.storage)
+        return [row for shard in range(self.storage.num_shards) for row in archiver.archived_rows(shard, query)]
+    
+    def search_student(self, student_id, cursor=None):
+        cursor = cursor or self.storage.conn_for_student(student_id).cursor()
+        cursor.execute(f"SELECT {', '.join(STUDENT_COLUMNS)} FROM students WHERE student_id = ?", (student_id,))
         row = cursor.fetchone()
         if row:
-            return {
-                'student_id': row[0],
-                'name': row[1],
-                'age': row[2],
-                'email': row[3],
-                'phone': row[4],
-                'courses': json.loads(row[5]),
-                'registration_date': row[6],
-                'status': row[7],
-                'grades': json.loads(row[8]),
-                'progress': json.loads(row[9]),
-                'fees_paid': json.loads(row[10]),
-                'email_verified': bool(row[11])
-            }
+            return StudentRecord.from_row(row)
         return None
     
     def add_course_to_student(self, student_id, course):
-        student = self.search_student(student_id)
-        if student and course not in student['courses']:
-            student['courses'].append(course)
-            student['grades'][course] = 'Not Assessed'
-            student['progress'][course] = '0%'
-            student['fees_paid'][course] = False
-            
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                UPDATE students SET 
-                courses = ?, grades = ?, progress = ?, fees_paid = ?
-                WHERE student_id = ?
-            ''', (
-                json.dumps(student['courses']),
-                json.dumps(student['grades']),
-                json.dumps(student['progress']),
-                json.dumps(student['fees_paid']),
-                student_id
-            ))
-            self.conn.commit()
-            return True
+        # Read through the joined cursor, after the write lock and BEGIN
+        # IMMEDIATE, so concurrent edits to the same student are not lost
+        with self.storage.unit_of_work() as uow:
+            cursor = uow.join(self.storage.conn_for_student(student_id))
+            student = self.search_student(student_id, cursor)
+            if student and course not in student['courses']:
+                student['courses'].append(course)
+                student['grades'][course] = 'Not Assessed'
+                student['progress'][course] = '0%'
+                student['fees_paid'][course] = False
+                
+                cursor.execute('''
+                    UPDATE students SET 
+                    courses = ?, grades = ?, progress = ?, fees_paid = ?
+                    WHERE student_id = ?
+                ''', (
+                    json.dumps(student['courses']),
+                    json.dumps(student['grades']),
+                    json.dumps(student['progress']),
+                    json.dumps(student['fees_paid']),
+                    student_id
+                ))
+                self._open_fee_balances(cursor, student_id, [course])
+                return True
         return False
     
     def update_student_progress(self, student_id, course, progress, grade=None):
-        student = self.search_student(student_id)
-        if student and course in student['courses']:
-            student['progress'][course] = progress
-            if grade:
-                student['grades'][course] = grade
-            
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                UPDATE students SET progress = ?, grades = ? WHERE student_id = ?
-            ''', (json.dumps(student['progress']), json.dumps(student['grades']), student_id))
-            self.conn.commit()
-            return True
+        with self.storage.unit_of_work() as uow:
+            cursor = uow.join(self.storage.conn_for_student(student_id))
+            student = self.search_student(student_id, cursor)
+            if student and course in student['courses']:
+                student['progress'][course] = progress
+                if grade:
+                    student['grades'][course] = grade
+                
+                cursor.execute('''
+                    UPDATE students SET progress = ?, grades = ? WHERE student_id = ?
+                ''', (json.dumps(student['progress']), json.dumps(student['grades']), student_id))
+                return True
         return False
 
 class CourseManager:
-    def __init__(self):
-        self.conn = DB_CONN
+    def __init__(self, storage=None):
+        self.storage = storage or STORAGE
+        self.conn = self.storage.primary
     
     def save_course_material(self, course_name, title, description, file_name, file_content, file_type, uploaded_by="Admin"):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO course_materials 
-            (course_name, title, description, file_name, file_content, file_type, upload_date, uploaded_by)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            course_name, title, description, file_name, 
-            file_content, file_type,
-            datetime.now().isoformat(), uploaded_by
-        ))
-        self.conn.commit()
-        return cursor.lastrowid
+        with self.storage.unit_of_work() as uow:
+            cursor = uow.join(self.conn)
+            cursor.execute('''
+                INSERT INTO course_materials 
+                (course_name, title, description, file_name, file_content, file_type, upload_date, uploaded_by)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                course_name, title, description, file_name, 
+                file_content, file_type,
+                datetime.now().isoformat(), uploaded_by
+            ))
+            material_id = cursor.lastrowid
+            
+            # Course materials are a reference table, replicated to every shard
+            cursor.execute("SELECT * FROM course_materials WHERE id = ?", (material_id,))
+            row = cursor.fetchone()
+            for conn in self.storage.connections()[1:]:
+                uow.join(conn).execute("INSERT OR REPLACE INTO course_materials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+        return material_id
     
-    def get_course_materials(self, course_name=None):
+    def get_course_materials(self, course_name=None, as_frame=False):
         cursor = self.conn.cursor()
+        query = f"SELECT {', '.join(MATERIAL_COLUMNS)} FROM course_materials"
         if course_name:
-            cursor.execute("SELECT * FROM course_materials WHERE course_name = ? ORDER BY upload_date DESC", (course_name,))
+            cursor.execute(query + " WHERE course_name = ? ORDER BY upload_date DESC", (course_name,))
         else:
-            cursor.execute("SELECT * FROM course_materials ORDER BY upload_date DESC")
+            cursor.execute(query + " ORDER BY upload_date DESC")
         
-        materials = []
-        for row in cursor.fetchall():
-            materials.append({
-                'id': row[0],
-                'course_name': row[1],
-                'title': row[2],
-                'description': row[3],
-                'file_name': row[4],
-                'file_content': row[5],
-                'file_type': row[6],
-                'upload_date': row[7],
-                'uploaded_by': row[8]
-            })
-        return materials
+        if as_frame:
+            return frame_from_cursor(cursor)
+        return [MaterialRecord._make(row) for row in cursor.fetchall()]
     
     def delete_course_material(self, material_id):
-        cursor = self.conn.cursor()
-        cursor.execute("DELETE FROM course_materials WHERE id = ?", (material_id,))
-        self.conn.commit()
+        with self.storage.unit_of_work() as uow:
+            cursor = uow.join(self.conn)
+            cursor.execute("DELETE FROM course_materials WHERE id = ?", (material_id,))
+            for conn in self.storage.connections()[1:]:
+                uow.join(conn).execute("DELETE FROM course_materials WHERE id = ?", (material_id,))
         return cursor.rowcount > 0
 
 class QuizManager:
-    def __init__(self):
-        self.conn = DB_CONN
+    def __init__(self, storage=None):
+        self.storage = storage or STORAGE
+        self.conn = self.storage.primary
     
-    def create_quiz(self, quiz_id, title, course, duration, questions):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO quizzes (quiz_id, title, course, duration, questions, created_date, is_active)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (quiz_id, title, course, duration, json.dumps(questions), datetime.now().isoformat(), True))
-        self.conn.commit()
+    def create_quiz(self, quiz_id, title, course, duration, questions, opens_at=None, closes_at=None):
+        # Quizzes are a reference table, replicated to every shard
+        created_date = datetime.now().isoformat()
+        opens_at = opens_at.isoformat() if opens_at else None
+        closes_at = closes_at.isoformat() if closes_at else None
+        with self.storage.unit_of_work() as uow:
+            for conn in self.storage.connections():
+                uow.join(conn).execute('''
+                    INSERT INTO quizzes (quiz_id, title, course, duration, questions, created_date, is_active, opens_at, closes_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (quiz_id, title, course, duration, json.dumps(questions), created_date, True, opens_at, closes_at))
     
-    def get_quizzes(self, course=None, active_only=True):
+    def get_quizzes(self, course=None, active_only=True, as_frame=False):
+        # active_only also hides scheduled quizzes outside their exam window
         cursor = self.conn.cursor()
+        query = f"SELECT {', '.join(QUIZ_COLUMNS)} FROM quizzes"
+        conditions, params = [], []
         if course:
-            if active_only:
-                cursor.execute("SELECT * FROM quizzes WHERE course = ? AND is_active = TRUE ORDER BY created_date DESC", (course,))
-            else:
-                cursor.execute("SELECT * FROM quizzes WHERE course = ? ORDER BY created_date DESC", (course,))
-        else:
-            if active_only:
-                cursor.execute("SELECT * FROM quizzes WHERE is_active = TRUE ORDER BY created_date DESC")
-            else:
-                cursor.execute("SELECT * FROM quizzes ORDER BY created_date DESC")
+            conditions.append("course = ?")
+            params.append(course)
+        if active_only:
+            now = datetime.now().isoformat()
+            conditions.append("is_active = TRUE AND (opens_at IS NULL OR opens_at <= ?) AND (closes_at IS NULL OR closes_at > ?)")
+            params.extend([now, now])
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        cursor.execute(query + " ORDER BY created_date DESC", params)
         
-        quizzes = []
-        for row in cursor.fetchall():
-            quizzes.append({
-                'quiz_id': row[0],
-                'title': row[1],
-                'course': row[2],
-                'duration': row[3],
-                'questions': json.loads(row[4]),
-                'created_date': row[5],
-                'is_active': bool(row[6])
-            })
-        return quizzes
+        if as_frame:
+            quizzes = frame_from_cursor(cursor)
+            quizzes['is_active'] = quizzes['is_active'].astype(bool)
+            return quizzes
+        return [QuizRecord.from_row(row) for row in cursor.fetchall()]
+    
+    def get_quiz(self, quiz_id):
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT {', '.join(QUIZ_COLUMNS)} FROM quizzes WHERE quiz_id = ?", (quiz_id,))
+        row = cursor.fetchone()
+        return QuizRecord.from_row(row) if row else None
     
     def save_quiz_result(self, quiz_id, student_id, score, total_questions, answers):
         percentage = (score / total_questions) * 100
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO quiz_results 
-            (quiz_id, student_id, score, total_questions, percentage, completed_date, answers)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (quiz_id, student_id, score, total_questions, percentage, datetime.now().isoformat(), json.dumps(answers)))
-        self.conn.commit()
+        with self.storage.unit_of_work() as uow:
+            cursor = uow.join(self.storage.conn_for_student(student_id))
+            cursor.execute('''
+                INSERT INTO quiz_results 
+                (quiz_id, student_id, score, total_questions, percentage, completed_date, answers)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (quiz_id, student_id, score, total_questions, percentage, datetime.now().isoformat(), json.dumps(answers)))
         return cursor.lastrowid
     
-    def get_student_results(self, student_id):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT qr.*, q.title, q.course 
+    def get_student_results(self, student_id, as_frame=False, include_archived=False):
+        # Only hot (current term) results unless archived terms are requested
+        conn = self.storage.conn_for_student(student_id)
+        query = '''
+            SELECT qr.quiz_id, qr.student_id, qr.score, qr.total_questions, qr.percentage,
+                   qr.completed_date, q.title AS quiz_title, q.course
             FROM quiz_results qr
-            JOIN quizzes q ON qr.quiz_id = q.quiz_id
+            JOIN {quizzes} q ON qr.quiz_id = q.quiz_id
             WHERE qr.student_id = ?
             ORDER BY qr.completed_date DESC
+        '''
+        cursor = conn.cursor()
+        cursor.execute(query.format(quizzes='quizzes'), (student_id,))
+        
+        if include_archived:
+            shard = self.storage.connections().index(conn)
+            rows = cursor.fetchall() + TermArchiver(self.storage).archived_rows(shard, query.format(quizzes='hot.quizzes'), (student_id,))
+            rows.sort(key=lambda row: row[5], reverse=True)
+            if as_frame:
+                return pd.DataFrame.from_records(rows, columns=RESULT_COLUMNS)
+            return [ResultRecord._make(row) for row in rows]
+        
+        if as_frame:
+            return frame_from_cursor(cursor)
+        return [ResultRecord._make(row) for row in cursor.fetchall()]
+
+class OutstandingRecord(RecordMixin, namedtuple('OutstandingRecord', (
+        'student_id', 'name', 'course', 'amount_due', 'amount_paid', 'balance', 'due_date', 'last_payment_date'))):
+    __slots__ = ()
+
+class AgingRecord(RecordMixin, namedtuple('AgingRecord', ('bucket', 'enrollments', 'balance'))):
+    __slots__ = ()
+
+class RevenueRecord(RecordMixin, namedtuple('RevenueRecord', ('course', 'payments', 'revenue'))):
+    __slots__ = ()
+
+AGING_BUCKETS = ('Not yet due', '1-30 days', '31-60 days', '61-90 days', '90+ days')
+
+class FinanceManager:
+    # Payments ledger plus a per-enrollment balance kept current by the
+    # payments_apply_balance trigger; reports are answered from indexes
+    def __init__(self, storage=None):
+        self.storage = storage or STORAGE
+        self.conn = self.storage.primary
+    
+    def set_course_fee(self, course, amount):
+        # course_fees is a reference table, replicated to every shard
+        with self.storage.unit_of_work() as uow:
+            for conn in self.storage.connections():
+                cursor = uow.join(conn)
+                cursor.execute('''
+                    INSERT OR REPLACE INTO course_fees (course, amount, updated_date) VALUES (?, ?, ?)
+                ''', (course, amount, datetime.now().isoformat()))
+                cursor.execute('''
+                    UPDATE fee_balances SET amount_due = ?, balance = ? - amount_paid
+                    WHERE course = ? AND legacy_paid = FALSE
+                ''', (amount, amount, course))
+    
+    def get_course_fees(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT course, amount FROM course_fees")
+        return dict(cursor.fetchall())
+    
+    def record_payment(self, student_id, course, amount, paid_date=None, reference=None, method="Manual"):
+        with self.storage.unit_of_work() as uow:
+            cursor = uow.join(self.storage.conn_for_student(student_id))
+            cursor.execute("SELECT 1 FROM fee_balances WHERE student_id = ? AND course = ?", (student_id, course))
+            if not cursor.fetchone():
+                return None
+            cursor.execute('''
+                INSERT INTO payments (student_id, course, amount, paid_date, reference, method, recorded_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (student_id, course, amount, paid_date or datetime.now().date().isoformat(), reference, method, datetime.now().isoformat()))
+        return cursor.lastrowid
+    
+    def read_bank_statement(self, file):
+        # Bank statement CSV with columns: reference, student_id, course, amount, date
+        text = file.read()
+        if isinstance(text, bytes):
+            text = text.decode('utf-8-sig')
+        return list(csv.DictReader(StringIO(text)))
+    
+    def import_payments(self, rows, method="Bank Import"):
+        # Validates every line first, then applies the whole statement in one
+        # transaction per shard. Lines whose reference was already imported are
+        # skipped, so re-importing a statement is harmless.
+        payments, errors = [], []
+        for line, row in enumerate(rows, start=2):
+            try:
+                amount = float(row['amount'])
+                paid_date = datetime.fromisoformat(row['date'].strip()).date().isoformat()
+                student_id, course, reference = row['student_id'].strip(), row['course'].strip(), row['reference'].strip()
+            except (KeyError, ValueError, AttributeError, TypeError) as e:
+                # TypeError: DictReader fills the fields missing from a short line with None
+                errors.append(f"Line {line}: {e}")
+                continue
+            if not math.isfinite(amount) or amount <= 0 or not reference:
+                errors.append(f"Line {line}: amount must be a positive number and reference is required")
+                continue
+            cursor = self.storage.conn_for_student(student_id).cursor()
+            cursor.execute("SELECT 1 FROM fee_balances WHERE student_id = ? AND course = ?", (student_id, course))
+            if not cursor.fetchone():
+                errors.append(f"Line {line}: {student_id} is not enrolled in {course}")
+                continue
+            payments.append((student_id, course, amount, paid_date, reference, method, datetime.now().isoformat()))
+        if errors:
+            raise ValueError("\n".join(errors))
+        
+        by_shard = {}
+        for payment in payments:
+            by_shard.setdefault(self.storage.conn_for_student(payment[0]), []).append(payment)
+        applied = 0
+        with self.storage.unit_of_work() as uow:
+            for conn in self.storage.connections():
+                if conn in by_shard:
+                    cursor = uow.join(conn)
+                    cursor.executemany('''
+                        INSERT OR IGNORE INTO payments (student_id, course, amount, paid_date, reference, method, recorded_date)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', by_shard[conn])
+                    applied += cursor.rowcount
+        return {'applied': applied, 'duplicates': len(payments) - applied}
+    
+    def outstanding_balances(self, course=None, as_frame=False):
+        # Balances stay hot when term archiving moves an inactive student out,
+        # so they are kept here (and in aging_report) with a placeholder name
+        query = '''
+            SELECT fb.student_id, COALESCE(s.name, '(archived)'), fb.course, fb.amount_due, fb.amount_paid, fb.balance,
+                   fb.due_date, fb.last_payment_date
+            FROM fee_balances fb
+            LEFT JOIN students s ON s.student_id = fb.student_id
+            WHERE fb.balance > 0 {course_filter}
+            ORDER BY fb.due_date
+        '''.format(course_filter="AND fb.course = ?" if course else "")
+        params = (course,) if course else ()
+        shard_rows = self.storage.map_shards(lambda conn: conn.execute(query, params).fetchall())
+        rows = sorted((row for rows in shard_rows for row in rows), key=lambda row: row[6])
+        if as_frame:
+            return pd.DataFrame.from_records(rows, columns=OutstandingRecord._fields)
+        return [OutstandingRecord._make(row) for row in rows]
+    
+    def aging_report(self, as_of=None, as_frame=False):
+        as_of = (as_of or datetime.now().date()).isoformat()
+        query = '''
+            SELECT CASE
+                       WHEN due_date >= :as_of THEN 0
+                       WHEN due_date >= date(:as_of, '-30 days') THEN 1
+                       WHEN due_date >= date(:as_of, '-60 days') THEN 2
+                       WHEN due_date >= date(:as_of, '-90 days') THEN 3
+                       ELSE 4
+                   END AS bucket,
+                   COUNT(*), SUM(balance)
+            FROM fee_balances
+            WHERE balance > 0
+            GROUP BY bucket
+        '''
+        totals = {bucket: [0, 0.0] for bucket in range(len(AGING_BUCKETS))}
+        for rows in self.storage.map_shards(lambda conn: conn.execute(query, {'as_of': as_of}).fetchall()):
+            for bucket, count, balance in rows:
+                totals[bucket][0] += count
+                totals[bucket][1] += balance
+        records = [AgingRecord(AGING_BUCKETS[bucket], count, balance) for bucket, (count, balance) in totals.items()]
+        if as_frame:
+            return pd.DataFrame.from_records(records, columns=AgingRecord._fields)
+        return records
+    
+    def revenue_by_course(self, start=None, end=None, as_frame=False):
+        query = "SELECT course, COUNT(*), SUM(amount) FROM payments WHERE paid_date >= ? AND paid_date < ? GROUP BY course"
+        params = (start.isoformat() if start else '', end.isoformat() if end else '9999')
+        totals = {}
+        for rows in self.storage.map_shards(lambda conn: conn.execute(query, params).fetchall()):
+            for course, count, revenue in rows:
+                current = totals.get(course, (0, 0.0))
+                totals[course] = (current[0] + count, current[1] + revenue)
+        records = [RevenueRecord(course, count, revenue) for course, (count, revenue) in sorted(totals.items())]
+        if as_frame:
+            return pd.DataFrame.from_records(records, columns=RevenueRecord._fields)
+        return records
+
+class ItemAnalysisRecord(RecordMixin, namedtuple('ItemAnalysisRecord', ('quiz_id', 'attempts', 'alpha', 'items'))):
+    __slots__ = ()
+
+OPTION_LETTERS = "ABCD"
+OPTION_INDEX = {letter: n for n, letter in enumerate(OPTION_LETTERS)}
+
+class ResponseMatrix:
+    # Growable attempts x questions matrix of chosen option indexes (-1 = unanswered)
+    def __init__(self, num_questions):
+        self.responses = np.full((64, num_questions), -1, dtype=np.int8)
+        self.rows = 0
+        self.last_ids = {}  # shard -> last quiz_results.id folded in
+    
+    def append(self, rows):
+        needed = self.rows + len(rows)
+        if needed > len(self.responses):
+            grown = np.full((max(needed, 2 * len(self.responses)), self.responses.shape[1]), -1, dtype=np.int8)
+            grown[:self.rows] = self.responses[:self.rows]
+            self.responses = grown
+        self.responses[self.rows:needed] = rows
+        self.rows = needed
+    
+    @property
+    def matrix(self):
+        return self.responses[:self.rows]
+
+class ItemAnalyzer:
+    # Item statistics from the answers stored by save_quiz_result(), which map
+    # question index -> chosen option letter. Response matrices are cached per
+    # quiz and only the results saved since the last call are decoded.
+    def __init__(self, storage=None):
+        self.storage = storage or STORAGE
+        self.matrices = {}
+        self.lock = threading.Lock()
+    
+    def _decode(self, answers, num_questions):
+        row = np.full(num_questions, -1, dtype=np.int8)
+        answers = json.loads(answers)
+        items = enumerate(answers) if isinstance(answers, list) else answers.items()
+        for question, letter in items:
+            question = int(question)
+            # Exactly one option letter; anything else ("", "AB", None, lists) is unanswered
+            option = OPTION_INDEX.get(letter) if isinstance(letter, str) else None
+            if 0 <= question < num_questions and option is not None:
+                row[question] = option
+        return row
+    
+    def response_matrix(self, quiz):
+        num_questions = len(quiz['questions'])
+        with self.lock:
+            matrix = self.matrices.get(quiz['quiz_id'])
+            if matrix is None or matrix.responses.shape[1] != num_questions:
+                matrix = self.matrices[quiz['quiz_id']] = ResponseMatrix(num_questions)
+            for shard, conn in enumerate(self.storage.connections()):
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, answers FROM quiz_results WHERE quiz_id = ? AND id > ? ORDER BY id
+                ''', (quiz['quiz_id'], matrix.last_ids.get(shard, 0)))
+                rows = cursor.fetchall()
+                if rows:
+                    matrix.append(np.stack([self._decode(answers, num_questions) for _, answers in rows]))
+                    matrix.last_ids[shard] = rows[-1][0]
+            return matrix.matrix.copy()
+    
+    def analyze(self, quiz):
+        questions = quiz['questions']
+        responses = self.response_matrix(quiz)
+        attempts, num_questions = responses.shape
+        if attempts == 0 or num_questions == 0:
+            return ItemAnalysisRecord(quiz['quiz_id'], attempts, float('nan'), pd.DataFrame())
+        
+        key = np.array([OPTION_LETTERS.index(q['correct']) for q in questions])
+        scored = (responses == key).astype(float)
+        totals = scored.sum(axis=1)
+        
+        # Difficulty index: share of attempts answering the item correctly
+        difficulty = scored.mean(axis=0)
+        
+        # Point-biserial discrimination against the rest score (total minus the item)
+        rest = totals[:, None] - scored
+        scored_dev = scored - difficulty
+        rest_dev = rest - rest.mean(axis=0)
+        denominator = np.sqrt((scored_dev ** 2).sum(axis=0) * (rest_dev ** 2).sum(axis=0))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            discrimination = np.where(denominator > 0, (scored_dev * rest_dev).sum(axis=0) / denominator, np.nan)
+        
+        # Share of attempts choosing each option, per item
+        options = np.arange(len(OPTION_LETTERS))
+        frequencies = (responses[None, :, :] == options[:, None, None]).mean(axis=1)
+        unanswered = (responses == -1).mean(axis=0)
+        
+        # Cronbach's alpha over the scored matrix
+        total_variance = totals.var(ddof=1) if attempts > 1 else 0.0
+        if num_questions > 1 and total_variance > 0:
+            alpha = num_questions / (num_questions - 1) * (1 - scored.var(axis=0, ddof=1).sum() / total_variance)
+        else:
+            alpha = float('nan')
+        
+        # A distractor picked more often than the key suggests a misleading item
+        distractors = frequencies.copy()
+        distractors[key, np.arange(num_questions)] = -1
+        misleading = distractors.max(axis=0) > difficulty
+        
+        flags = []
+        for i in range(num_questions):
+            item_flags = []
+            if difficulty[i] > 0.9:
+                item_flags.append("Too easy")
+            elif difficulty[i] < 0.2:
+                item_flags.append("Too hard")
+            if misleading[i]:
+                item_flags.append("Misleading")
+            if not np.isnan(discrimination[i]) and discrimination[i] < 0.2:
+                item_flags.append("Low discrimination")
+            flags.append(", ".join(item_flags))
+        
+        items = pd.DataFrame({
+            'question': [q['question'] for q in questions],
+            'correct': [q['correct'] for q in questions],
+            'difficulty': difficulty.round(2),
+            'discrimination': discrimination.round(2),
+        })
+        for option, letter in enumerate(OPTION_LETTERS):
+            items[f'{letter} %'] = (frequencies[option] * 100).round(1)
+        items['unanswered %'] = (unanswered * 100).round(1)
+        items['flags'] = flags
+        return ItemAnalysisRecord(quiz['quiz_id'], attempts, float(alpha), items)
+
+class ChangeRecord(RecordMixin, namedtuple('ChangeRecord', ('shard', 'seq', 'table_name', 'op', 'row_key', 'changed_at'))):
+    __slots__ = ()
+
+class ChangeFeed:
+    # Incremental consumers (caches, search, analytics, SIS sync) read the
+    # trigger-populated changes table from their last acknowledged sequence
+    # number. Ops are insert/update/delete, plus 'archive' for rows that term
+    # archiving moved out of the hot tables. Each shard keeps its own sequence
+    # and consumer cursors; reference table changes are only read from the
+    # primary since the other shards hold replicas of the same rows.
+    def __init__(self, storage=None):
+        self.storage = storage or STORAGE
+    
+    def register_consumer(self, consumer, from_latest=False):
+        with self.storage.unit_of_work() as uow:
+            for conn in self.storage.connections():
+                cursor = uow.join(conn)
+                start = 0
+                if from_latest:
+                    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM changes")
+                    start = cursor.fetchone()[0]
+                cursor.execute('''
+                    INSERT OR IGNORE INTO change_consumers (consumer, last_seq, updated_date) VALUES (?, ?, ?)
+                ''', (consumer, start, datetime.now().isoformat()))
+    
+    def read_changes(self, consumer, batch_size=500):
+        changes = []
+        for shard, conn in enumerate(self.storage.connections()):
+            cursor = conn.cursor()
+            cursor.execute("SELECT last_seq FROM change_consumers WHERE consumer = ?", (consumer,))
+            row = cursor.fetchone()
+            if row is None:
+                raise KeyError(f"Unknown change feed consumer: {consumer}")
+            
+            query = "SELECT seq, table_name, op, row_key, changed_at FROM changes WHERE seq > ?"
+            if shard > 0:
+                query += f" AND table_name NOT IN ({', '.join('?' * len(REFERENCE_TABLES))})"
+            cursor.execute(query + " ORDER BY seq LIMIT ?",
+                           (row[0], *(REFERENCE_TABLES if shard > 0 else ()), batch_size))
+            changes.extend(ChangeRecord(shard, *change) for change in cursor.fetchall())
+        return changes
+    
+    def acknowledge(self, consumer, changes):
+        # Advance the consumer's cursor past every change in the processed batch
+        last_seqs = {}
+        for change in changes:
+            last_seqs[change.shard] = max(last_seqs.get(change.shard, 0), change.seq)
+        connections = self.storage.connections()
+        with self.storage.unit_of_work() as uow:
+            for shard, last_seq in sorted(last_seqs.items()):
+                uow.join(connections[shard]).execute('''
+                    UPDATE change_consumers SET last_seq = MAX(last_seq, ?), updated_date = ? WHERE consumer = ?
+                ''', (last_seq, datetime.now().isoformat(), consumer))
+    
+    def student_version(self, student_id):
+        # Sequence number of the student's latest row change (0 if compacted away)
+        cursor = self.storage.conn_for_student(student_id).cursor()
+        cursor.execute('''
+            SELECT COALESCE(MAX(seq), 0) FROM changes WHERE table_name = 'students' AND row_key = ?
         ''', (student_id,))
+        return cursor.fetchone()[0]
+    
+    def table_version(self, table_name):
+        # Latest change to a table; reference tables are read from the primary
+        cursor = self.storage.primary.cursor()
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM changes WHERE table_name = ?", (table_name,))
+        return cursor.fetchone()[0]
+    
+    def compact(self):
+        # Trim entries that every registered consumer has already processed.
+        # With no consumers registered there is nobody to replay for: only the
+        # last CHANGE_FEED_RETENTION_DAYS are kept (a consumer registered later
+        # starts from there), enough for the version checks of cached profiles
+        # and quiz lists, which only compare the newest entry per row or table.
+        deleted = 0
+        with self.storage.unit_of_work() as uow:
+            for shard, conn in enumerate(self.storage.connections()):
+                cursor = uow.join(conn)
+                cursor.execute('''
+                    DELETE FROM changes WHERE
+                        CASE WHEN EXISTS (SELECT 1 FROM change_consumers)
+                             THEN seq <= (SELECT MIN(last_seq) FROM change_consumers)
+                             ELSE changed_at < strftime('%Y-%m-%dT%H:%M:%f', 'now', ?)
+                        END
+                ''', (f"-{CHANGE_FEED_RETENTION_DAYS} days",))
+                deleted += cursor.rowcount
+                if shard > 0:
+                    # Replica entries for reference tables are never read
+                    cursor.execute(f"DELETE FROM changes WHERE table_name IN ({', '.join('?' * len(REFERENCE_TABLES))})", REFERENCE_TABLES)
+                    deleted += cursor.rowcount
+        return deleted
+
+class AdmissionControl:
+    # Caps concurrent quiz starts; later arrivals wait in arrival order instead
+    # of every session contending for the database at the same moment
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiting = []
+        self.condition = threading.Condition()
+    
+    @contextmanager
+    def slot(self, timeout=120):
+        start = time.perf_counter()
+        ticket = object()
+        with self.condition:
+            self.waiting.append(ticket)
+            admitted = self.condition.wait_for(
+                lambda: self.waiting[0] is ticket and self.active < self.limit, timeout
+            )
+            self.waiting.remove(ticket)
+            self.condition.notify_all()
+            if not admitted:
+                raise TimeoutError("Too many quiz starts in progress")
+            self.active += 1
+        try:
+            yield (time.perf_counter() - start) * 1000
+        finally:
+            with self.condition:
+                self.active -= 1
+                self.condition.notify_all()
+
+class ExamLatencyRecord(RecordMixin, namedtuple('ExamLatencyRecord', ('event', 'count', 'p50_ms', 'p95_ms', 'max_ms', 'queued_p95_ms'))):
+    __slots__ = ()
+
+EXAM_EVENTS = ('start', 'submit')
+
+class ExamScheduler:
+    # One per server process. A background tick loads quizzes whose exam window
+    # opens within EXAM_PREWARM_MINUTES, together with the profiles of every
+    # student enrolled in their course, so the cohort's logins and Start Quiz
+    # clicks are served from memory. Start/submit latencies are buffered and
+    # written to exam_events in batches for the per-window report. A quiz's
+    # profiles are dropped again once its window has closed.
+    def __init__(self, storage=None, interval_seconds=30, max_concurrent_starts=None):
+        self.storage = storage or STORAGE
+        self.quiz_manager = QuizManager(self.storage)
+        self.change_feed = ChangeFeed(self.storage)
+        self.admission = AdmissionControl(max_concurrent_starts or EXAM_MAX_CONCURRENT_STARTS)
+        self.interval_seconds = interval_seconds
+        self.lock = threading.Lock()
+        self.quizzes = []
+        self.quiz_version = None
+        self.profiles = {}
+        self.prewarmed = {}
+        self.events = []
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def _run(self):
+        while True:
+            try:
+                self.tick()
+            except Exception:
+                # Retried on the next tick (e.g. when the database is locked);
+                # the thread must survive or prewarming and event flushes stop
+                logger.exception("Exam scheduler tick failed")
+            time.sleep(self.interval_seconds)
+    
+    def tick(self, now=None):
+        now = now or datetime.now()
+        horizon = (now + timedelta(minutes=EXAM_PREWARM_MINUTES)).isoformat()
+        quizzes = self._quiz_list()
+        for quiz in quizzes:
+            if (quiz['quiz_id'] not in self.prewarmed and quiz['is_active'] and quiz['opens_at']
+                    and quiz['opens_at'] <= horizon and (quiz['closes_at'] is None or quiz['closes_at'] > now.isoformat())):
+                self.prewarm(quiz)
+        self.prune(quizzes, now)
+        self.flush_events()
+    
+    def prune(self, quizzes, now):
+        # Forget quizzes that closed, were deactivated or deleted, and the
+        # profiles no other prewarmed quiz still needs
+        live = {quiz['quiz_id'] for quiz in quizzes
+                if quiz['is_active'] and (quiz['closes_at'] is None or quiz['closes_at'] > now.isoformat())}
+        with self.lock:
+            expired = [quiz_id for quiz_id in self.prewarmed if quiz_id not in live]
+            for quiz_id in expired:
+                del self.prewarmed[quiz_id]
+            if expired:
+                needed = set().union(*self.prewarmed.values())
+                self.profiles = {student_id: cached for student_id, cached in self.profiles.items() if student_id in needed}
+        return len(expired)
+    
+    def _quiz_list(self):
+        # Reload the quiz list only when the quizzes table changed
+        version = self.change_feed.table_version('quizzes')
+        with self.lock:
+            if version != self.quiz_version:
+                self.quizzes = self.quiz_manager.get_quizzes(active_only=False)
+                self.quiz_version = version
+            return self.quizzes
+    
+    def prewarm(self, quiz):
+        # Profiles are stored with their change-feed version, so a student edited
+        # after prewarming is read from the database again
+        query = f'''
+            SELECT {', '.join('s.' + column for column in STUDENT_COLUMNS)},
+                   (SELECT COALESCE(MAX(seq), 0) FROM changes c
+                    WHERE c.table_name = 'students' AND c.row_key = s.student_id)
+            FROM students s
+            WHERE s.status = 'Active' AND EXISTS (SELECT 1 FROM json_each(s.courses) WHERE value = ?)
+        '''
+        profiles = {}
+        for rows in self.storage.map_shards(lambda conn: conn.execute(query, (quiz['course'],)).fetchall()):
+            for row in rows:
+                profiles[row[0]] = (row[-1], StudentRecord.from_row(row[:-1]))
+        with self.lock:
+            self.profiles.update(profiles)
+            self.prewarmed[quiz['quiz_id']] = set(profiles)
+        return len(profiles)
+    
+    def available_quizzes(self, courses, now=None):
+        return [quiz for quiz in self._quiz_list() if quiz['course'] in courses and quiz.is_open(now)]
+    
+    def quiz_payload(self, quiz_id, now=None):
+        # The quiz if its window is open right now, else None
+        return next((quiz for quiz in self._quiz_list() if quiz['quiz_id'] == quiz_id and quiz.is_open(now)), None)
+    
+    def cached_profile(self, student_id, version):
+        cached = self.profiles.get(student_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        return None
+    
+    def record_event(self, quiz_id, student_id, event, latency_ms, queued_ms=0):
+        with self.lock:
+            self.events.append((quiz_id, student_id, event, latency_ms, queued_ms, datetime.now().isoformat()))
+    
+    def flush_events(self):
+        with self.lock:
+            events, self.events = self.events, []
+        if events:
+            with self.storage.unit_of_work() as uow:
+                uow.join(self.storage.primary).executemany('''
+                    INSERT INTO exam_events (quiz_id, student_id, event, latency_ms, queued_ms, recorded_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', events)
+    
+    def window_report(self, quiz_id, as_frame=False):
+        self.flush_events()
+        cursor = self.storage.primary.cursor()
+        records = []
+        for event in EXAM_EVENTS:
+            cursor.execute("SELECT latency_ms, queued_ms FROM exam_events WHERE quiz_id = ? AND event = ?", (quiz_id, event))
+            timings = np.array(cursor.fetchall(), dtype=float).reshape(-1, 2)
+            if len(timings):
+                p50, p95 = np.percentile(timings[:, 0], [50, 95])
+                records.append(ExamLatencyRecord(event, len(timings), round(p50, 1), round(p95, 1),
+                                                 round(timings[:, 0].max(), 1), round(np.percentile(timings[:, 1], 95), 1)))
+            else:
+                records.append(ExamLatencyRecord(event, 0, None, None, None, None))
+        if as_frame:
+            return pd.DataFrame.from_records(records, columns=ExamLatencyRecord._fields)
+        return records
+
+def term_for_date(value):
+    # Academic terms are half-years: 2026-T1 (Jan-Jun) and 2026-T2 (Jul-Dec)
+    date = datetime.fromisoformat(value) if isinstance(value, str) else value
+    return f"{date.year}-T{1 if date.month <= 6 else 2}"
+
+def term_bounds(term):
+    year, half = int(term[:4]), int(term[-1])
+    if half == 1:
+        return datetime(year, 1, 1), datetime(year, 7, 1)
+    return datetime(year, 7, 1), datetime(year + 1, 1, 1)
+
+def database_path(conn):
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA database_list")
+    return cursor.fetchone()[2]
+
+class TermArchiver:
+    # Moves closed terms' quiz_results and inactive students out of the hot
+    # tables into per-term archive files (one per shard). Archived rows keep
+    # their ids, so a batch interrupted between the archive insert and the hot
+    # delete (WAL does not make multi-file commits atomic) is healed by re-running.
+    ARCHIVE_PATTERN = re.compile(r'cre8learn_archive_(\d{4}-T[12])(?:_shard(\d+))?\.db$')
+    
+    def __init__(self, storage=None, archive_dir=None):
+        self.storage = storage or STORAGE
+        self.archive_dir = archive_dir or DATA_DIR
+    
+    def archive_path(self, term, shard=0):
+        suffix = f"_shard{shard}" if self.storage.num_shards > 1 else ""
+        return os.path.join(self.archive_dir, f"cre8learn_archive_{term}{suffix}.db")
+    
+    def archived_terms(self, shard=0):
+        terms = []
+        for file_name in os.listdir(self.archive_dir):
+            match = self.ARCHIVE_PATTERN.match(file_name)
+            if match and int(match.group(2) or 0) == shard:
+                terms.append(match.group(1))
+        return sorted(terms)
+    
+    def oldest_closed_date(self):
+        # Oldest hot row that belongs to a closed term (None if there is none);
+        # two index lookups per shard, cheap enough for every dashboard rerun
+        current_start = term_bounds(term_for_date(datetime.now()))[0].isoformat()
+        oldest = []
+        for conn in self.storage.connections():
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT MIN(completed_date) FROM quiz_results WHERE completed_date < ?
+                UNION ALL
+                SELECT MIN(registration_date) FROM students WHERE status != 'Active' AND registration_date < ?
+            ''', (current_start, current_start))
+            oldest.extend(date for (date,) in cursor.fetchall() if date)
+        return min(oldest) if oldest else None
+    
+    def closed_terms(self):
+        current_start = term_bounds(term_for_date(datetime.now()))[0].isoformat()
+        terms = set()
+        for conn in self.storage.connections():
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT DISTINCT substr(completed_date, 1, 7) FROM quiz_results WHERE completed_date < ?
+                UNION
+                SELECT DISTINCT substr(registration_date, 1, 7) FROM students WHERE registration_date < ? AND status != 'Active'
+            ''', (current_start, current_start))
+            terms.update(term_for_date(f"{month}-01") for (month,) in cursor.fetchall())
+        return sorted(terms)
+    
+    def archive_term(self, term, batch_size=1000):
+        start, end = term_bounds(term)
+        if end > datetime.now():
+            raise ValueError(f"Term {term} is not closed yet")
         
-        results = []
-        for row in cursor.fetchall():
-            results.append({
-                'quiz_id': row[1],
-                'student_id': row[2],
-                'score': row[3],
-                'total_questions': row[4],
-                'percentage': row[5],
-                'completed_date': row[6],
-                'quiz_title': row[8],
-                'course': row[9]
-            })
-        return results
+        moved = {'quiz_results': 0, 'students': 0}
+        for shard, hot in enumerate(self.storage.connections()):
+            cursor = hot.cursor()
+            cursor.execute('''
+                SELECT 1 FROM quiz_results WHERE completed_date >= ? AND completed_date < ?
+                UNION ALL
+                SELECT 1 FROM students WHERE status != 'Active' AND registration_date >= ? AND registration_date < ?
+                LIMIT 1
+            ''', (start.isoformat(), end.isoformat()) * 2)
+            if not cursor.fetchone():
+                continue
+            
+            # A dedicated connection keeps the ATTACH away from the shared one
+            conn = sqlite3.connect(database_path(hot), timeout=30)
+            try:
+                conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path(term, shard),))
+                self._init_archive(conn)
+                moved['quiz_results'] += self._move_batches(conn, 'quiz_results', 'id', '''
+                    SELECT id FROM main.quiz_results WHERE completed_date >= ? AND completed_date < ? LIMIT ?
+                ''', (start.isoformat(), end.isoformat()), batch_size)
+                # Inactive students are archived with their registration term once
+                # none of their results remain in the hot table
+                moved['students'] += self._move_batches(conn, 'students', 'student_id', '''
+                    SELECT s.student_id FROM main.students s
+                    WHERE s.status != 'Active' AND s.registration_date >= ? AND s.registration_date < ?
+                    AND NOT EXISTS (SELECT 1 FROM main.quiz_results qr WHERE qr.student_id = s.student_id)
+                    LIMIT ?
+                ''', (start.isoformat(), end.isoformat()), batch_size)
+                conn.execute("DETACH DATABASE archive")
+            finally:
+                conn.close()
+        return moved
+    
+    def archive_closed_terms(self, batch_size=1000):
+        return {term: self.archive_term(term, batch_size) for term in self.closed_terms()}
+    
+    def _init_archive(self, conn):
+        for table in ('quiz_results', 'students'):
+            conn.execute(f"CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0")
+            # Carry over columns added to the hot table after the archive was created
+            archived = [row[1] for row in conn.execute(f"PRAGMA archive.table_info({table})")]
+            for row in conn.execute(f"PRAGMA main.table_info({table})").fetchall():
+                if row[1] not in archived:
+                    conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {row[1]} {row[2]}")
+        conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_results_student ON quiz_results (student_id)")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_archive_results_id ON quiz_results (id)")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_archive_students_id ON students (student_id)")
+        conn.commit()
+    
+    def _move_batches(self, conn, table, key, select_keys, params, batch_size):
+        cursor = conn.cursor()
+        cursor.execute(f"PRAGMA archive.table_info({table})")
+        columns = ', '.join(row[1] for row in cursor.fetchall())
+        moved = 0
+        while True:
+            cursor.execute(select_keys, (*params, batch_size))
+            keys = [row[0] for row in cursor.fetchall()]
+            if not keys:
+                return moved
+            marks = ', '.join('?' * len(keys))
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO archive.{table} ({columns})
+                SELECT {columns} FROM main.{table} WHERE {key} IN ({marks})
+            ''', keys)
+            cursor.execute(f"DELETE FROM main.{table} WHERE {key} IN ({marks})", keys)
+            # The delete triggers just logged one change per row; this transaction
+            # holds the write lock, so they are the newest entries. Tag them so
+            # feed consumers can tell archiving from deletion.
+            cursor.execute('''
+                UPDATE main.changes SET op = 'archive'
+                WHERE table_name = ? AND op = 'delete' AND seq > (SELECT MAX(seq) FROM main.changes) - ?
+            ''', (table, cursor.rowcount))
+            conn.commit()
+            moved += len(keys)
+    
+    def archived_rows(self, shard, query, params=()):
+        # Runs query against each of the shard's archives with the hot shard
+        # attached as "hot" (for joins to quizzes and other reference tables)
+        hot_path = database_path(self.storage.connections()[shard])
+        rows = []
+        for term in self.archived_terms(shard):
+            conn = sqlite3.connect(self.archive_path(term, shard), timeout=30)
+            try:
+                conn.execute("ATTACH DATABASE ? AS hot", (hot_path,))
+                rows.extend(conn.execute(query, params).fetchall())
+            finally:
+                conn.close()
+        return rows
+    
+    def historical_connection(self, shard=0, terms=None):
+        # Hot shard with archive terms ATTACHed as term_2025_T1, ... for ad-hoc
+        # historical reports. SQLite allows at most 10 attached databases.
+        terms = terms or self.archived_terms(shard)
+        if len(terms) > 9:
+            raise ValueError("At most 9 archive terms can be attached at once")
+        conn = sqlite3.connect(database_path(self.storage.connections()[shard]), timeout=30)
+        for term in terms:
+            conn.execute(f"ATTACH DATABASE ? AS term_{term.replace('-', '_')}", (self.archive_path(term, shard),))
+        return conn
+
+def archive_job(storage, params, progress):
+    archiver = TermArchiver(storage)
+    terms = archiver.closed_terms()
+    moved = {}
+    for n, term in enumerate(terms):
+        progress(n / len(terms), f"Archiving {term}")
+        moved[term] = archiver.archive_term(term)
+    results_moved = sum(counts['quiz_results'] for counts in moved.values())
+    students_moved = sum(counts['students'] for counts in moved.values())
+    progress(1, f"Archived {results_moved} quiz results and {students_moved} inactive students")
+    return moved
+
+def import_payments_job(storage, params, progress):
+    progress(0, f"Importing {len(params['rows'])} statement lines")
+    summary = FinanceManager(storage).import_payments(params['rows'])
+    progress(1, f"Applied {summary['applied']} payments ({summary['duplicates']} already imported)")
+    return summary
+
+def export_students_job(storage, params, progress):
+    # The CSV goes to a file next to the database; the job result keeps only its
+    # path, so exports never grow the hot jobs table
+    students = StudentManager(storage).get_students(as_frame=True, include_archived=params.get('include_archived', False))
+    progress(0.5, f"Writing {len(students)} students")
+    export_dir = os.path.join(os.path.dirname(database_path(storage.primary)), 'exports')
+    os.makedirs(export_dir, exist_ok=True)
+    prune_exports(export_dir)
+    path = os.path.join(export_dir, f"students_{datetime.now():%Y%m%d_%H%M%S_%f}.csv")
+    students.to_csv(path, index=False)
+    progress(1, f"Exported {len(students)} students")
+    return {'rows': len(students), 'path': path}
+
+def prune_exports(export_dir):
+    cutoff = time.time() - EXPORT_RETENTION_DAYS * 86400
+    for name in os.listdir(export_dir):
+        path = os.path.join(export_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            # Pruned by another server process
+            pass
+
+def read_export(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+def compact_change_feed_job(storage, params, progress):
+    deleted = ChangeFeed(storage).compact()
+    progress(1, f"Removed {deleted} change entries")
+    return {'deleted': deleted}
+
+# Handlers run on pool threads next to page sessions that share the storage's
+# connections: their writes go through the managers' unit of work (import,
+# compaction) or through dedicated connections (archiving), never a bare commit
+JOB_HANDLERS = {
+    'archive_closed_terms': archive_job,
+    'import_payments': import_payments_job,
+    'export_students': export_students_job,
+    'compact_change_feed': compact_change_feed_job,
+}
+
+class JobRecord(RecordMixin, namedtuple('JobRecord', (
+        'job_id', 'kind', 'status', 'progress', 'message', 'error', 'created_date', 'finished_date'))):
+    __slots__ = ()
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class JobRunner:
+    # Runs heavy admin actions on a bounded thread pool owned by the server
+    # process, so they keep going after the admin's tab closes or reruns. The
+    # jobs table holds status, progress and results; submissions with the same
+    # idempotency key return the existing job instead of starting another.
+    def __init__(self, storage=None, max_workers=None):
+        self.storage = storage or STORAGE
+        # Job bookkeeping commits on its own connection, never inside a page's transaction
+        self.conn = sqlite3.connect(database_path(self.storage.primary), check_same_thread=False, timeout=30)
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers or JOB_WORKERS, thread_name_prefix='cre8learn-job')
+        self._recover()
+    
+    def _execute(self, query, params=()):
+        with self.lock:
+            cursor = self.conn.execute(query, params)
+            self.conn.commit()
+            return cursor
+    
+    def _recover(self):
+        # Queued jobs are picked up again; running jobs whose process is gone are failed
+        rows = self.conn.execute("SELECT job_id, status, worker FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        for job_id, status, worker in rows:
+            if status == 'queued':
+                self.pool.submit(self._run, job_id)
+            elif worker is None or worker == os.getpid() or not process_alive(worker):
+                # A restarted server often gets the same PID (PID 1 in containers),
+                # and this runner has not started anything yet
+                self._execute('''
+                    UPDATE jobs SET status = 'failed', error = 'Interrupted by a server restart', finished_date = ?
+                    WHERE job_id = ? AND status = 'running'
+                ''', (datetime.now().isoformat(), job_id))
+    
+    def submit(self, kind, params=None, idempotency_key=None):
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        params = json.dumps(params or {}, sort_keys=True)
+        idempotency_key = idempotency_key or f"{kind}:{hashlib.sha256(params.encode()).hexdigest()}"
+        cursor = self._execute('''
+            INSERT OR IGNORE INTO jobs (kind, idempotency_key, params, created_date) VALUES (?, ?, ?, ?)
+        ''', (kind, idempotency_key, params, datetime.now().isoformat()))
+        if cursor.rowcount:
+            job_id = cursor.lastrowid
+        else:
+            job_id = self.conn.execute("SELECT job_id FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone()[0]
+            # A failed job may be retried under the same key; anything else is a duplicate
+            cursor = self._execute('''
+                UPDATE jobs SET status = 'queued', params = ?, progress = 0, message = NULL, result = NULL,
+                                error = NULL, worker = NULL, started_date = NULL, finished_date = NULL
+                WHERE job_id = ? AND status = 'failed'
+            ''', (params, job_id))
+            if not cursor.rowcount:
+                return job_id
+        self.pool.submit(self._run, job_id)
+        return job_id
+    
+    def _run(self, job_id):
+        # Claiming the job atomically keeps two server processes from running it twice
+        cursor = self._execute('''
+            UPDATE jobs SET status = 'running', worker = ?, started_date = ? WHERE job_id = ? AND status = 'queued'
+        ''', (os.getpid(), datetime.now().isoformat(), job_id))
+        if not cursor.rowcount:
+            return
+        kind, params = self.conn.execute("SELECT kind, params FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        
+        def progress(fraction, message=None):
+            self._execute('''
+                UPDATE jobs SET progress = ?, message = COALESCE(?, message) WHERE job_id = ?
+            ''', (fraction, message, job_id))
+        
+        try:
+            result = JOB_HANDLERS[kind](self.storage, json.loads(params), progress)
+        except Exception as e:
+            self._execute('''
+                UPDATE jobs SET status = 'failed', error = ?, finished_date = ? WHERE job_id = ?
+            ''', (str(e), datetime.now().isoformat(), job_id))
+        else:
+            self._execute('''
+                UPDATE jobs SET status = 'succeeded', progress = 1, result = ?, finished_date = ? WHERE job_id = ?
+            ''', (json.dumps(result), datetime.now().isoformat(), job_id))
+    
+    def get_jobs(self, limit=50, as_frame=False):
+        # Results (an export holds a whole roster) are only read by job_result()
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute(f'''
+                SELECT {', '.join(JobRecord._fields)} FROM jobs ORDER BY job_id DESC LIMIT ?
+            ''', (limit,))
+            if as_frame:
+                return frame_from_cursor(cursor)
+            return [JobRecord._make(row) for row in cursor.fetchall()]
+    
+    def job_result(self, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT result FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+    
+    def has_active_jobs(self):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM jobs WHERE status IN ('queued', 'running') LIMIT 1").fetchone() is not None
 
 def create_logo():
     st.markdown("""
@@ -494,13 +1915,102 @@ def admin_login():
             st.rerun()
         return True
 
+class RateLimiter:
+    # Sliding-window limiter shared by every session served by this process
+    def __init__(self, max_calls, window_seconds):
+        self.max_calls = max_calls
+        self.window_seconds = window_seconds
+        self.calls = {}
+        self.lock = threading.Lock()
+    
+    def allow(self, key):
+        now = time.monotonic()
+        with self.lock:
+            calls = [t for t in self.calls.get(key, []) if now - t < self.window_seconds]
+            allowed = len(calls) < self.max_calls
+            if allowed:
+                calls.append(now)
+            self.calls[key] = calls
+            if len(self.calls) > 10000:
+                # Drop keys of sessions that have gone quiet
+                self.calls = {k: v for k, v in self.calls.items() if v and now - v[-1] < self.window_seconds}
+            return allowed
+
+# Response matrices are cached for the whole process, not per session
+@st.cache_resource
+def get_item_analyzer(backend, data_dir):
+    return ItemAnalyzer(get_storage(backend, data_dir))
+
+# Student ID lookups: a few per session per minute, and a process-wide cap so
+# brute-force guessing from many sessions cannot hammer the database either
+@st.cache_resource
+def get_lookup_limiters():
+    return RateLimiter(max_calls=5, window_seconds=60), RateLimiter(max_calls=50, window_seconds=1)
+
+# Exam-day prewarming and admission control are shared by every session
+@st.cache_resource
+def get_exam_scheduler(backend, data_dir):
+    return ExamScheduler(get_storage(backend, data_dir))
+
+# Jobs keep running after the session that submitted them ends
+@st.cache_resource
+def get_job_runner(backend, data_dir):
+    return JobRunner(get_storage(backend, data_dir))
+
+def student_login(student_manager, change_feed, exam_scheduler):
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("Student Access")
+    
+    student = st.session_state.get('student_profile')
+    if student is None:
+        if 'session_key' not in st.session_state:
+            st.session_state.session_key = f"{time.time_ns()}-{random.random()}"
+        student_id = st.sidebar.text_input("Enter Your Student ID").strip()
+        if st.sidebar.button("Login as Student"):
+            session_limiter, global_limiter = get_lookup_limiters()
+            if not session_limiter.allow(st.session_state.session_key) or not global_limiter.allow('all'):
+                st.sidebar.error("Too many attempts. Please wait a minute and try again.")
+            elif student_id:
+                # Read the version first so a change made during the lookup triggers a refresh
+                version = change_feed.student_version(student_id)
+                student = exam_scheduler.cached_profile(student_id, version) or student_manager.search_student(student_id)
+                if student:
+                    st.session_state.student_profile = student
+                    st.session_state.student_version = version
+                    st.rerun()
+                else:
+                    st.sidebar.error("Student ID not found. Please check your ID.")
+        return None
+    
+    # Reruns only re-read the profile when the student's change version moved
+    version = change_feed.student_version(student['student_id'])
+    if version != st.session_state.student_version:
+        student = (exam_scheduler.cached_profile(student['student_id'], version)
+                   or student_manager.search_student(student['student_id']))
+        st.session_state.student_profile = student
+        st.session_state.student_version = version
+        if student is None:
+            st.rerun()
+    
+    st.sidebar.success(f"✅ {student['name']} ({student['student_id']})")
+    if st.sidebar.button("Logout", key="student_logout"):
+        st.session_state.student_profile = None
+        st.rerun()
+    return student
+
 def main():
     # Initialize managers
     student_manager = StudentManager()
     course_manager = CourseManager()
     quiz_manager = QuizManager()
+    finance_manager = FinanceManager()
+    item_analyzer = get_item_analyzer(STORAGE_BACKEND, DATA_DIR)
+    change_feed = ChangeFeed(student_manager.storage)
+    exam_scheduler = get_exam_scheduler(STORAGE_BACKEND, DATA_DIR)
+    job_runner = get_job_runner(STORAGE_BACKEND, DATA_DIR)
     
     is_admin = admin_login()
+    student = None if is_admin else student_login(student_manager, change_feed, exam_scheduler)
     create_logo()
     
     # Courses list
@@ -524,6 +2034,8 @@ def main():
             "👥 Student Management",
             "📚 Course Materials",
             "🎯 Quiz Management",
+            "💰 Fees & Payments",
+            "⚙️ Jobs",
             "📊 Analytics & Reports"
         ]
     else:
@@ -567,6 +2079,19 @@ def main():
                 for student in recent_students:
                     verified_status = "✅" if student['email_verified'] else "❌"
                     st.write(f"**{student['name']}** ({student['student_id']}) {verified_status}")
+            
+            with col2:
+                st.subheader("Term Archiving")
+                archiver = TermArchiver(student_manager.storage)
+                oldest = archiver.oldest_closed_date()
+                if oldest:
+                    st.write(f"Closed terms with hot data, oldest from {term_for_date(oldest)}")
+                    if st.button("🗄️ Archive Closed Terms"):
+                        # The job lists the closed terms; the oldest hot date moves once it succeeds
+                        job_id = job_runner.submit('archive_closed_terms', idempotency_key=f"archive_closed_terms:{oldest}")
+                        st.success(f"✅ Archiving started as job #{job_id}. Follow it on the ⚙️ Jobs page.")
+                else:
+                    st.info("No closed terms to archive.")
 
         elif choice == "➕ Register Student":
             st.subheader("Register New Student")
@@ -582,6 +2107,7 @@ def main():
                 with col2:
                     phone = st.text_input("Phone Number *")
                     selected_courses = st.multiselect("Select Courses *", COURSES)
+                    campus = st.selectbox("Campus *", CAMPUSES) if len(CAMPUSES) > 1 else DEFAULT_CAMPUS
                     auto_verify = st.checkbox("Auto-verify email", value=True)
                 
                 submitted = st.form_submit_button("🎯 Register Student")
@@ -591,16 +2117,16 @@ def main():
                         if not student_manager.verify_email_format(email):
                             st.error("❌ Please enter a valid email address!")
                         else:
-                            # REGISTER STUDENT FIRST
-                            student_id = student_manager.add_student(name, age, email, phone, selected_courses)
+                            # Register and verify (or store the code) in one transaction
+                            with student_manager.storage.unit_of_work():
+                                student_id = student_manager.add_student(name, age, email, phone, selected_courses, campus)
+                                if auto_verify:
+                                    student_manager.mark_email_verified(student_id)
+                                else:
+                                    verification_code = student_manager.generate_verification_code()
+                                    student_manager.save_verification_code(email, verification_code)
                             
                             if auto_verify:
-                                # Auto-verify the email
-                                cursor = DB_CONN.cursor()
-                                cursor.execute('''
-                                    UPDATE students SET email_verified = TRUE WHERE student_id = ?
-                                ''', (student_id,))
-                                DB_CONN.commit()
                                 st.success(f"""
                                 ✅ Student registered successfully!
                                 
@@ -610,10 +2136,6 @@ def main():
                                 **Email:** ✅ Verified
                                 """)
                             else:
-                                # Send verification code
-                                verification_code = student_manager.generate_verification_code()
-                                student_manager.save_verification_code(email, verification_code)
-                                
                                 st.success(f"""
                                 ✅ Student registered successfully!
                                 
@@ -630,10 +2152,24 @@ def main():
         elif choice == "👥 Student Management":
             st.subheader("Student Management")
             
-            students = student_manager.get_students()
-            if students:
-                for student in students:
-                    with st.expander(f"🎯 {student['name']} ({student['student_id']})"):
+            # One dataframe widget for the whole roster instead of an expander per student
+            include_archived = st.checkbox("Include archived students")
+            students = student_manager.get_students(as_frame=True, include_archived=include_archived)
+            if not students.empty:
+                roster = students[['student_id', 'name', 'email', 'phone', 'status', 'campus', 'email_verified']].copy()
+                roster['courses'] = students['courses'].map(lambda courses: len(json.loads(courses)))
+                if len(CAMPUSES) == 1:
+                    roster = roster.drop(columns=['campus'])
+                st.dataframe(roster, width='stretch', hide_index=True)
+                if st.button("📤 Export Roster CSV"):
+                    job_id = job_runner.submit('export_students', {'include_archived': include_archived},
+                                               idempotency_key=f"export_students:{include_archived}:{datetime.now():%Y-%m-%dT%H:%M}")
+                    st.success(f"✅ Export queued as job #{job_id}. Download it from the ⚙️ Jobs page.")
+                
+                selected_id = st.text_input("Student ID to view details")
+                student = student_manager.search_student(selected_id) if selected_id else None
+                if student:
+                    with st.expander(f"🎯 {student['name']} ({student['student_id']})", expanded=True):
                         col1, col2 = st.columns(2)
                         
                         with col1:
@@ -641,6 +2177,8 @@ def main():
                             st.write(f"**Email:** {student['email']}")
                             st.write(f"**Phone:** {student['phone']}")
                             st.write(f"**Status:** {student['status']}")
+                            if len(CAMPUSES) > 1:
+                                st.write(f"**Campus:** {student['campus']}")
                             st.write(f"**Verified:** {'✅ Yes' if student['email_verified'] else '❌ No'}")
                         
                         with col2:
@@ -649,6 +2187,8 @@ def main():
                                 progress = student['progress'][course]
                                 grade = student['grades'][course]
                                 st.write(f"• **{course}:** {progress} | {grade}")
+                elif selected_id:
+                    st.error("Student ID not found.")
 
         elif choice == "📚 Course Materials":
             st.subheader("Course Materials Management")
@@ -721,6 +2261,18 @@ def main():
                 quiz_course = st.selectbox("Course *", COURSES)
                 quiz_duration = st.number_input("Duration (minutes) *", min_value=1, max_value=180, value=30)
                 
+                opens_at = closes_at = None
+                if st.checkbox("Schedule exam window"):
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        open_date = st.date_input("Opens on", key="exam_open_date")
+                        open_time = st.time_input("Opens at", key="exam_open_time")
+                    with col2:
+                        close_date = st.date_input("Closes on", key="exam_close_date")
+                        close_time = st.time_input("Closes at", value=(datetime.now() + timedelta(hours=2)).time(), key="exam_close_time")
+                    opens_at = datetime.combine(open_date, open_time)
+                    closes_at = datetime.combine(close_date, close_time)
+                
                 st.subheader("Add Questions")
                 
                 if 'quiz_questions' not in st.session_state:
@@ -752,9 +2304,12 @@ def main():
                         st.write(f"{i+1}. {q['question']}")
                 
                 if st.button("Create Quiz", type="primary"):
-                    if quiz_title and quiz_course and st.session_state.quiz_questions:
+                    if opens_at and closes_at <= opens_at:
+                        st.error("The exam window must close after it opens!")
+                    elif quiz_title and quiz_course and st.session_state.quiz_questions:
                         quiz_id = f"quiz_{int(time.time())}"
-                        quiz_manager.create_quiz(quiz_id, quiz_title, quiz_course, quiz_duration, st.session_state.quiz_questions)
+                        quiz_manager.create_quiz(quiz_id, quiz_title, quiz_course, quiz_duration, st.session_state.quiz_questions,
+                                                 opens_at, closes_at)
                         st.session_state.quiz_questions = []
                         st.success(f"✅ Quiz '{quiz_title}' created successfully!")
                     else:
@@ -771,139 +2326,299 @@ def main():
                             st.write(f"**Questions:** {len(quiz['questions'])}")
                             st.write(f"**Created:** {quiz['created_date'][:16]}")
                             st.write(f"**Status:** {'✅ Active' if quiz['is_active'] else '❌ Inactive'}")
+                            if quiz['opens_at']:
+                                st.write(f"**Exam window:** {quiz['opens_at'][:16]} to {quiz['closes_at'][:16]}")
+                                st.write("**Window Latency (ms)**")
+                                st.dataframe(exam_scheduler.window_report(quiz['quiz_id'], as_frame=True),
+                                             width='stretch', hide_index=True)
+                            
+                            st.write("**Item Analysis**")
+                            analysis = item_analyzer.analyze(quiz)
+                            if analysis.attempts:
+                                st.write(f"**Attempts analysed:** {analysis.attempts} | **Cronbach's alpha:** {analysis.alpha:.2f}")
+                                st.dataframe(analysis.items, width='stretch', hide_index=True)
+                            else:
+                                st.info("No attempts to analyse yet.")
+
+        elif choice == "💰 Fees & Payments":
+            st.subheader("Fees & Payments")
+            
+            tab1, tab2, tab3, tab4, tab5 = st.tabs(["💳 Outstanding", "⏳ Aging", "📈 Revenue", "🏦 Import Payments", "🏷️ Course Fees"])
+            
+            with tab1:
+                fee_course = st.selectbox("Course", ["All courses"] + COURSES, key="outstanding_course")
+                outstanding = finance_manager.outstanding_balances(
+                    None if fee_course == "All courses" else fee_course, as_frame=True
+                )
+                if not outstanding.empty:
+                    st.metric("Total Outstanding", f"M{outstanding['balance'].sum():,.2f}")
+                    st.dataframe(outstanding, width='stretch', hide_index=True)
+                else:
+                    st.info("No outstanding balances.")
+            
+            with tab2:
+                st.dataframe(finance_manager.aging_report(as_frame=True), width='stretch', hide_index=True)
+            
+            with tab3:
+                col1, col2 = st.columns(2)
+                with col1:
+                    revenue_start = st.date_input("From", value=datetime.now().date().replace(month=1, day=1))
+                with col2:
+                    revenue_end = st.date_input("To", value=datetime.now().date())
+                revenue = finance_manager.revenue_by_course(revenue_start, revenue_end + timedelta(days=1), as_frame=True)
+                if not revenue.empty:
+                    st.metric("Total Revenue", f"M{revenue['revenue'].sum():,.2f}")
+                    st.dataframe(revenue, width='stretch', hide_index=True)
+                else:
+                    st.info("No payments in this period.")
+            
+            with tab4:
+                st.write("Upload a bank statement CSV with columns: reference, student_id, course, amount, date")
+                statement = st.file_uploader("Bank statement *", type=['csv'])
+                if st.button("Import Payments"):
+                    if statement:
+                        # The same statement submitted twice maps to the same job
+                        job_id = job_runner.submit('import_payments', {'rows': finance_manager.read_bank_statement(statement)})
+                        st.success(f"✅ Import queued as job #{job_id}. Follow it on the ⚙️ Jobs page.")
+                    else:
+                        st.error("Please upload a bank statement file")
+            
+            with tab5:
+                course_fees = finance_manager.get_course_fees()
+                fee_course = st.selectbox("Course", COURSES, key="fee_course")
+                fee_amount = st.number_input("Fee (M)", min_value=0.0, value=float(course_fees.get(fee_course, 0.0)), step=50.0)
+                if st.button("Save Fee"):
+                    finance_manager.set_course_fee(fee_course, fee_amount)
+                    st.success(f"✅ Fee for '{fee_course}' set to M{fee_amount:,.2f}")
+
+        elif choice == "⚙️ Jobs":
+            st.subheader("Background Jobs")
+            
+            if st.button("🧹 Compact Change Feed"):
+                job_id = job_runner.submit('compact_change_feed', idempotency_key=f"compact_change_feed:{datetime.now():%Y-%m-%dT%H:%M}")
+                st.success(f"✅ Compaction queued as job #{job_id}")
+            
+            # Only this fragment reruns while jobs are in flight, the rest of the page stays put
+            polling = job_runner.has_active_jobs()
+            st.session_state.job_list_runs = 0
+            
+            @st.fragment(run_every=2 if polling else None)
+            def job_list():
+                st.session_state.job_list_runs += 1
+                jobs = job_runner.get_jobs()
+                if not jobs:
+                    st.info("No jobs yet.")
+                    return
+                st.dataframe(
+                    pd.DataFrame.from_records(jobs, columns=JobRecord._fields),
+                    width='stretch', hide_index=True,
+                    column_config={'progress': st.column_config.ProgressColumn("progress", min_value=0, max_value=1)}
+                )
+                for job in jobs:
+                    if job['kind'] == 'export_students' and job['status'] == 'succeeded':
+                        # The result is just the file's path; the CSV is read only when the button is clicked
+                        path = (job_runner.job_result(job['job_id']) or {}).get('path')
+                        if path and os.path.exists(path):
+                            st.download_button(f"📥 Download export #{job['job_id']} ({job['message']})",
+                                               lambda path=path: read_export(path),
+                                               file_name=f"students_{job['job_id']}.csv",
+                                               mime='text/csv', key=f"download_job_{job['job_id']}")
+                        else:
+                            st.caption(f"Export #{job['job_id']} has expired (kept {EXPORT_RETENTION_DAYS} days).")
+                # Stop polling once everything has finished (a full rerun drops run_every)
+                if polling and st.session_state.job_list_runs > 1 and not any(job['status'] in ('queued', 'running') for job in jobs):
+                    st.rerun()
+            
+            job_list()
 
     # STUDENT SECTIONS
     else:
         if choice == "🏠 Student Portal":
             st.subheader("Welcome to Cre8Learn Institute")
             
-            student_id = st.text_input("Enter Your Student ID")
-            if student_id:
-                student = student_manager.search_student(student_id)
-                if student:
-                    st.success(f"Welcome back, {student['name']}! 🎉")
-                    
-                    # Dashboard
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        st.metric("Courses", len(student['courses']))
-                    with col2:
-                        completed = sum(1 for course in student['courses'] if student['progress'][course] == '100%')
-                        st.metric("Completed", completed)
-                    with col3:
-                        email_status = "✅ Verified" if student['email_verified'] else "❌ Pending"
-                        st.metric("Email Status", email_status)
+            if student:
+                st.success(f"Welcome back, {student['name']}! 🎉")
+                
+                # Dashboard
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("Courses", len(student['courses']))
+                with col2:
+                    completed = sum(1 for course in student['courses'] if student['progress'][course] == '100%')
+                    st.metric("Completed", completed)
+                with col3:
+                    email_status = "✅ Verified" if student['email_verified'] else "❌ Pending"
+                    st.metric("Email Status", email_status)
+                
+                # Email verification section
+                if not student['email_verified']:
+                    st.markdown("---")
+                    st.subheader("📧 Verify Your Email")
+                    st.warning("Your email is not verified. Please verify to access all features.")
                     
-                    # Email verification section
-                    if not student['email_verified']:
-                        st.markdown("---")
-                        st.subheader("📧 Verify Your Email")
-                        st.warning("Your email is not verified. Please verify to access all features.")
-                        
-                        verification_code = st.text_input("Enter verification code:")
-                        if st.button("Verify Email"):
-                            if student_manager.verify_email_code(student['email'], verification_code):
-                                st.success("✅ Email verified successfully!")
-                                st.rerun()
-                            else:
-                                st.error("❌ Invalid verification code!")
+                    verification_code = st.text_input("Enter verification code:")
+                    if st.button("Verify Email"):
+                        if student_manager.verify_email_code(student['email'], verification_code):
+                            st.success("✅ Email verified successfully!")
+                            st.rerun()
+                        else:
+                            st.error("❌ Invalid verification code!")
+                
+                # Course progress
+                st.subheader("📚 Your Course Progress")
+                for course in student['courses']:
+                    progress = student['progress'][course]
+                    grade = student['grades'][course]
                     
-                    # Course progress
-                    st.subheader("📚 Your Course Progress")
-                    for course in student['courses']:
-                        progress = student['progress'][course]
-                        grade = student['grades'][course]
-                        
-                        st.markdown(f"""
-                        <div class="student-card">
-                            <strong>📖 {course}</strong><br>
-                            Progress: <strong>{progress}</strong> | Grade: <strong>{grade}</strong><br>
-                            Status: {'✅ Completed' if progress == '100%' else '📚 In Progress'}
-                        </div>
-                        """, unsafe_allow_html=True)
-                else:
-                    st.error("Student ID not found. Please check your ID.")
+                    st.markdown(f"""
+                    <div class="student-card">
+                        <strong>📖 {course}</strong><br>
+                        Progress: <strong>{progress}</strong> | Grade: <strong>{grade}</strong><br>
+                        Status: {'✅ Completed' if progress == '100%' else '📚 In Progress'}
+                    </div>
+                    """, unsafe_allow_html=True)
+            else:
+                st.info("Please log in with your Student ID in the sidebar.")
 
         elif choice == "📖 Learning Materials":
-            student_id = st.text_input("Enter Your Student ID")
-            if student_id:
-                student = student_manager.search_student(student_id)
-                if student:
-                    st.subheader("Available Learning Materials")
-                    
-                    for course in student['courses']:
-                        st.write(f"### 📚 {course}")
-                        materials = course_manager.get_course_materials(course)
-                        
-                        if materials:
-                            for material in materials:
-                                st.markdown(f"""
-                                <div class="material-card">
-                                    <strong>📄 {material['title']}</strong><br>
-                                    {material['description']}<br>
-                                    <small>Available since: {material['upload_date'][:16]}</small>
-                                </div>
-                                """, unsafe_allow_html=True)
-                                
-                                # Download button
-                                st.download_button(
-                                    label=f"Download {material['file_name']}",
-                                    data=material['file_content'],
-                                    file_name=material['file_name'],
-                                    mime=material['file_type'],
-                                    key=f"dl_{material['id']}"
-                                )
-                                st.write("---")
-                        else:
-                            st.info("No materials available for this course yet.")
-
-        elif choice == "🎯 Take Quiz":
-            student_id = st.text_input("Enter Your Student ID")
-            if student_id:
-                student = student_manager.search_student(student_id)
-                if student:
-                    st.subheader("Available Quizzes")
-                    
-                    available_quizzes = []
-                    for course in student['courses']:
-                        quizzes = quiz_manager.get_quizzes(course=course, active_only=True)
-                        available_quizzes.extend(quizzes)
+            if student:
+                st.subheader("Available Learning Materials")
+                
+                for course in student['courses']:
+                    st.write(f"### 📚 {course}")
+                    materials = course_manager.get_course_materials(course)
                     
-                    if available_quizzes:
-                        for quiz in available_quizzes:
+                    if materials:
+                        for material in materials:
                             st.markdown(f"""
-                            <div class="quiz-card">
-                                <strong>🎯 {quiz['title']}</strong><br>
-                                Course: {quiz['course']}<br>
-                                Duration: {quiz['duration']} minutes<br>
-                                Questions: {len(quiz['questions'])}
+                            <div class="material-card">
+                                <strong>📄 {material['title']}</strong><br>
+                                {material['description']}<br>
+                                <small>Available since: {material['upload_date'][:16]}</small>
                             </div>
                             """, unsafe_allow_html=True)
                             
-                            if st.button("Start Quiz", key=f"start_{quiz['quiz_id']}"):
-                                st.session_state.current_quiz = quiz
-                                st.session_state.quiz_start_time = datetime.now()
-                                st.session_state.quiz_answers = {}
-                                st.rerun()
+                            # Download button
+                            st.download_button(
+                                label=f"Download {material['file_name']}",
+                                data=material['file_content'],
+                                file_name=material['file_name'],
+                                mime=material['file_type'],
+                                key=f"dl_{material['id']}"
+                            )
+                            st.write("---")
+                    else:
+                        st.info("No materials available for this course yet.")
+            else:
+                st.info("Please log in with your Student ID in the sidebar.")
+
+        elif choice == "🎯 Take Quiz":
+            def quiz_form(quiz):
+                st.subheader(f"🎯 {quiz['title']}")
+                st.write(f"Duration: {quiz['duration']} minutes | Started: {st.session_state.quiz_start_time.strftime('%H:%M')}")
+                with st.form("take_quiz_form"):
+                    answers = {}
+                    for i, question in enumerate(quiz['questions']):
+                        choice_label = st.radio(
+                            f"{i+1}. {question['question']}",
+                            [f"{OPTION_LETTERS[n]}. {option}" for n, option in enumerate(question['options'])],
+                            index=None, key=f"answer_{quiz['quiz_id']}_{i}"
+                        )
+                        if choice_label:
+                            answers[str(i)] = choice_label[0]
+                    return st.form_submit_button("Submit Quiz", type="primary"), answers
+            
+            if student and st.session_state.get('current_quiz_id'):
+                quiz_id = st.session_state.current_quiz_id
+                quiz, submitted, answers = None, False, {}
+                if not st.session_state.quiz_started:
+                    # A start is the rerun that loads the quiz and renders it for the
+                    # first time; starts beyond the concurrency limit queue for a slot
+                    try:
+                        with st.spinner("Starting your quiz..."):
+                            with exam_scheduler.admission.slot() as queued_ms:
+                                quiz = exam_scheduler.quiz_payload(quiz_id)
+                                if quiz:
+                                    st.session_state.quiz_start_time = datetime.now()
+                                    submitted, answers = quiz_form(quiz)
+                        if quiz:
+                            st.session_state.quiz_started = True
+                            exam_scheduler.record_event(quiz_id, student['student_id'], 'start',
+                                                        (time.perf_counter() - st.session_state.quiz_requested_at) * 1000, queued_ms)
+                    except TimeoutError:
+                        st.session_state.current_quiz_id = None
+                        st.warning("The exam is very busy right now. Please try again in a moment.")
+                else:
+                    quiz = exam_scheduler.quiz_payload(quiz_id)
+                    if quiz:
+                        submitted, answers = quiz_form(quiz)
+                
+                if st.session_state.current_quiz_id and quiz is None:
+                    st.session_state.current_quiz_id = None
+                    st.error("❌ This quiz's exam window has closed.")
+                elif submitted:
+                    # Submissions are accepted until the window closes or the duration runs out
+                    deadline = st.session_state.quiz_start_time + timedelta(minutes=quiz['duration'], seconds=EXAM_SUBMIT_GRACE_SECONDS)
+                    if datetime.now() > deadline:
+                        st.session_state.current_quiz_id = None
+                        st.error("❌ Time is up. This attempt was not submitted.")
                     else:
-                        st.info("No quizzes available for your courses yet.")
+                        start = time.perf_counter()
+                        score = sum(answers.get(str(i)) == question['correct'] for i, question in enumerate(quiz['questions']))
+                        # The result and the course grade are committed together
+                        with quiz_manager.storage.unit_of_work():
+                            quiz_manager.save_quiz_result(quiz['quiz_id'], student['student_id'], score, len(quiz['questions']), answers)
+                            student_manager.update_student_progress(student['student_id'], quiz['course'],
+                                                                    student['progress'].get(quiz['course'], '0%'),
+                                                                    grade=f"{score * 100 / len(quiz['questions']):.0f}%")
+                        exam_scheduler.record_event(quiz['quiz_id'], student['student_id'], 'submit',
+                                                    (time.perf_counter() - start) * 1000)
+                        st.session_state.current_quiz_id = None
+                        st.success(f"✅ Quiz submitted! Score: {score}/{len(quiz['questions'])}")
+            
+            elif student:
+                st.subheader("Available Quizzes")
+                
+                available_quizzes = exam_scheduler.available_quizzes(student['courses'])
+                
+                if available_quizzes:
+                    for quiz in available_quizzes:
+                        closes = f"<br>Closes: {quiz['closes_at'][:16]}" if quiz['closes_at'] else ""
+                        st.markdown(f"""
+                        <div class="quiz-card">
+                            <strong>🎯 {quiz['title']}</strong><br>
+                            Course: {quiz['course']}<br>
+                            Duration: {quiz['duration']} minutes<br>
+                            Questions: {len(quiz['questions'])}{closes}
+                        </div>
+                        """, unsafe_allow_html=True)
+                        
+                        if st.button("Start Quiz", key=f"start_{quiz['quiz_id']}"):
+                            st.session_state.current_quiz_id = quiz['quiz_id']
+                            st.session_state.quiz_requested_at = time.perf_counter()
+                            st.session_state.quiz_started = False
+                            st.rerun()
+                else:
+                    st.info("No quizzes available for your courses yet.")
+            else:
+                st.info("Please log in with your Student ID in the sidebar.")
 
         elif choice == "📊 My Results":
-            student_id = st.text_input("Enter Your Student ID")
-            if student_id:
-                student = student_manager.search_student(student_id)
-                if student:
-                    st.subheader("Your Quiz Results")
-                    
-                    results = quiz_manager.get_student_results(student_id)
-                    if results:
-                        for result in results:
-                            st.write(f"**{result['quiz_title']}** ({result['course']})")
-                            st.write(f"Score: {result['score']}/{result['total_questions']} ({result['percentage']:.1f}%)")
-                            st.write(f"Completed: {result['completed_date'][:16]}")
-                            st.write("---")
-                    else:
-                        st.info("No quiz results yet.")
+            if student:
+                st.subheader("Your Quiz Results")
+                
+                include_archived = st.checkbox("Include previous terms")
+                results = quiz_manager.get_student_results(student['student_id'], include_archived=include_archived)
+                if results:
+                    for result in results:
+                        st.write(f"**{result['quiz_title']}** ({result['course']})")
+                        st.write(f"Score: {result['score']}/{result['total_questions']} ({result['percentage']:.1f}%)")
+                        st.write(f"Completed: {result['completed_date'][:16]}")
+                        st.write("---")
+                else:
+                    st.info("No quiz results yet.")
+            else:
+                st.info("Please log in with your Student ID in the sidebar.")
 
         elif choice == "📞 Contact Support":
             st.subheader("Contact Cre8Learn Institute")
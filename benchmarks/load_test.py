@@ -0,0 +1,246 @@
+# Offline load test: N concurrent admin and student sessions against a synthetic database.
+#
+#   python benchmarks/load_test.py --students 20 --admins 2 --iterations 5
+#
+# Every simulated session is a headless Streamlit AppTest driving app.py the
+# way a person would (admins register students and browse the roster, quiz
+# and material pages; students log in, browse materials, start quizzes and
+# view results). AppTest swaps process-global runtime state on every run, so
+# each session runs in its own process, like several server workers sharing
+# one database. Reports rerun latency percentiles, write-lock waits seen by a
+# probe writer, and memory per session.
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, 'app.py')
+sys.path.insert(0, ROOT)
+
+COURSES = [
+    "Computer Hardware Basics",
+    "Introduction to Computer Networking",
+    "C++ 1: Introductory Programming",
+]
+
+
+def build_database(app, roster_size):
+    # Synthetic roster, materials, quizzes and results through the app's own managers
+    student_manager = app.StudentManager()
+    course_manager = app.CourseManager()
+    quiz_manager = app.QuizManager()
+    student_ids = []
+    for n in range(roster_size):
+        courses = random.sample(COURSES, 2)
+        student_id = student_manager.add_student(f"Student {n}", 20, f"student{n}@load.cre8learn.com", "+266 5555 0000", courses)
+        student_ids.append(student_id)
+    for course in COURSES:
+        for n in range(3):
+            course_manager.save_course_material(course, f"{course} notes {n}", "Weekly notes", f"notes{n}.txt", b"x" * 20000, "text/plain")
+        questions = [{'question': f"Q{q}", 'options': ["a", "b", "c", "d"], 'correct': "A"} for q in range(10)]
+        quiz_manager.create_quiz(f"quiz_{abs(hash(course))}", f"{course} quiz", course, 30, questions)
+    for student_id in random.sample(student_ids, min(len(student_ids), 200)):
+        student = student_manager.search_student(student_id)
+        for quiz in quiz_manager.get_quizzes(course=student['courses'][0]):
+            quiz_manager.save_quiz_result(quiz['quiz_id'], student_id, random.randint(0, 10), 10, {})
+    return student_ids
+
+
+def widget(widgets, label):
+    return next(w for w in widgets if w.label == label)
+
+
+class Session:
+    def __init__(self, name, timings):
+        self.name = name
+        self.timings = timings
+        self.errors = 0
+        self.at = AppTest.from_file(APP_PATH, default_timeout=120)
+
+    def rerun(self, step, action=None):
+        start = time.perf_counter()
+        (action or self.at.run)()
+        self.timings.append((step, time.perf_counter() - start))
+        if self.at.exception:
+            self.errors += 1
+        if step == 'first load':
+            # Imports and the first script run are per-process, not per-session
+            self.rss_after_first_load = rss_bytes()
+
+    def page(self, title):
+        self.rerun(title, widget(self.at.sidebar.selectbox, "Menu").select(title).run)
+
+
+def admin_script(session, iteration):
+    if iteration == 0:
+        session.at.session_state['admin_logged_in'] = True
+        session.rerun('first load')
+    session.page("🏠 Admin Dashboard")
+    session.page("➕ Register Student")
+    at = session.at
+    tag = f"{session.name}-{iteration}-{time.time_ns()}"
+    widget(at.text_input, "Full Name *").input(f"Load {tag}")
+    widget(at.text_input, "Email *").input(f"{tag}@load.cre8learn.com")
+    widget(at.text_input, "Phone Number *").input("+266 5555 0001")
+    widget(at.multiselect, "Select Courses *").select(COURSES[0])
+    session.rerun('register student', widget(at.button, "🎯 Register Student").click().run)
+    session.page("👥 Student Management")
+    session.page("📚 Course Materials")
+    session.page("🎯 Quiz Management")
+
+
+def student_script(session, iteration, student_id):
+    at = session.at
+    if iteration == 0:
+        session.rerun('first load')
+        widget(at.sidebar.text_input, "Enter Your Student ID").input(student_id)
+        session.rerun('login', widget(at.sidebar.button, "Login as Student").click().run)
+    session.page("🏠 Student Portal")
+    session.page("📖 Learning Materials")
+    session.page("🎯 Take Quiz")
+    start_buttons = [b for b in at.button if b.label == "Start Quiz"]
+    if start_buttons:
+        session.rerun('start quiz', random.choice(start_buttons).click().run)
+    session.page("📊 My Results")
+
+
+def probe_lock_waits(db_path, stop, waits):
+    # A synthetic writer that measures how long it waits for the write lock
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    while not stop.is_set():
+        start = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        waits.append(time.perf_counter() - start)
+        conn.execute("ROLLBACK")
+        time.sleep(0.05)
+    conn.close()
+
+
+def rss_bytes():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_session(kind, name, student_id, iterations, data_dir, backend, ready, results):
+    os.environ['CRE8LEARN_DATA_DIR'] = data_dir
+    os.environ['CRE8LEARN_STORAGE'] = backend
+    rss_before = rss_bytes()
+    session = Session(name, [])
+    ready.wait()
+    try:
+        for iteration in range(iterations):
+            if kind == 'admin':
+                admin_script(session, iteration)
+            else:
+                student_script(session, iteration, student_id)
+    except Exception:
+        # A widget missing from the page means the rerun did not render as expected
+        session.errors += 1
+        traceback.print_exc()
+    baseline = getattr(session, 'rss_after_first_load', rss_before)
+    results.put((session.timings, session.errors, baseline - rss_before, rss_bytes() - baseline))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent-session load test for the Streamlit app')
+    parser.add_argument('--students', type=int, default=20, help='concurrent student sessions')
+    parser.add_argument('--admins', type=int, default=2, help='concurrent admin sessions')
+    parser.add_argument('--iterations', type=int, default=3, help='script repetitions per session')
+    parser.add_argument('--roster', type=int, default=2000, help='students in the synthetic database')
+    parser.add_argument('--backend', choices=['single', 'sharded'], default='single')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='cre8learn_load_')
+    os.environ['CRE8LEARN_DATA_DIR'] = data_dir
+    os.environ['CRE8LEARN_STORAGE'] = args.backend
+    import app
+
+    print(f"building synthetic database ({args.roster} students) in {data_dir}")
+    student_ids = build_database(app, args.roster)
+    db_path = app.database_path(app.STORAGE.primary)
+
+    # spawn, not fork: sessions must not inherit this process's SQLite connections
+    ctx = multiprocessing.get_context('spawn')
+    sessions = [('admin', f"admin{i}", None) for i in range(args.admins)]
+    sessions += [('student', f"student{i}", random.choice(student_ids)) for i in range(args.students)]
+    ready = ctx.Barrier(len(sessions) + 1)
+    results = ctx.Queue()
+    workers = [
+        ctx.Process(target=run_session, args=(*session, args.iterations, data_dir, args.backend, ready, results))
+        for session in sessions
+    ]
+    for worker in workers:
+        worker.start()
+
+    stop = threading.Event()
+    lock_waits = []
+    probe = threading.Thread(target=probe_lock_waits, args=(db_path, stop, lock_waits))
+    ready.wait(timeout=600)
+    probe.start()
+    start = time.perf_counter()
+    outcomes = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - start
+    for worker in workers:
+        worker.join()
+    stop.set()
+    probe.join()
+
+    timings = [timing for session_timings, _, _, _ in outcomes for timing in session_timings]
+    process_memory = [rss for _, _, rss, _ in outcomes]
+    session_memory = [rss for _, _, _, rss in outcomes]
+    latencies = [seconds for _, seconds in timings]
+    by_step = {}
+    for step, seconds in timings:
+        by_step.setdefault(step, []).append(seconds)
+    report = {
+        'sessions': {'admin': args.admins, 'student': args.students},
+        'backend': args.backend,
+        'roster': args.roster,
+        'reruns': len(latencies),
+        'errors': sum(errors for _, errors, _, _ in outcomes),
+        'elapsed_s': round(elapsed, 2),
+        'rerun_ms': {f"p{p}": round(percentile(latencies, p) * 1000, 1) for p in (50, 90, 95, 99)},
+        'rerun_ms_by_step': {step: round(statistics.median(values) * 1000, 1) for step, values in sorted(by_step.items())},
+        'lock_wait_ms': {
+            'probes': len(lock_waits),
+            'p50': round(percentile(lock_waits, 50) * 1000, 2),
+            'p95': round(percentile(lock_waits, 95) * 1000, 2),
+            'max': round(max(lock_waits) * 1000, 2),
+        },
+        'memory_per_process_mb': round(statistics.median(process_memory) / 2**20, 2),
+        'memory_per_session_mb': round(statistics.median(session_memory) / 2**20, 2),
+        'finished': datetime.now().isoformat(),
+    }
+
+    print(f"{len(sessions)} sessions, {report['reruns']} reruns in {report['elapsed_s']}s, {report['errors']} errors")
+    print("rerun latency ms   " + "  ".join(f"{k}={v}" for k, v in report['rerun_ms'].items()))
+    for step, median in report['rerun_ms_by_step'].items():
+        print(f"  {step:24s} p50 {median} ms")
+    print("write lock wait ms " + "  ".join(f"{k}={v}" for k, v in report['lock_wait_ms'].items()))
+    print(f"memory per session {report['memory_per_session_mb']} MiB (median RSS growth after the first load; "
+          f"imports and first load {report['memory_per_process_mb']} MiB)")
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# Compare the memory held by get_students() results at roster scale.
+#
+#   python benchmarks/record_memory_benchmark.py --students 50000
+#
+# Measures the per-row dicts the managers used to return, the namedtuple
+# records they return now, and the opt-in DataFrame mode (as_frame=True).
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['CRE8LEARN_DATA_DIR'] = tempfile.mkdtemp(prefix='cre8learn_bench_')
+
+import app  # noqa: E402
+
+COURSES = [
+    "Computer Hardware Basics",
+    "Introduction to Computer Networking",
+    "C++ 1: Introductory Programming",
+    "Proficiency in English Language",
+]
+
+
+def populate(conn, count):
+    rows = []
+    for n in range(count):
+        courses = random.sample(COURSES, random.randint(1, 3))
+        rows.append((
+            f"CL{100000 + n}", f"Student {n}", random.randint(16, 60), f"student{n}@bench.cre8learn.com",
+            "+266 5555 0000", json.dumps(courses), datetime.now().isoformat(), 'Active',
+            json.dumps({course: 'Not Assessed' for course in courses}),
+            json.dumps({course: '0%' for course in courses}),
+            json.dumps({course: False for course in courses}),
+            True, app.DEFAULT_CAMPUS,
+        ))
+    conn.executemany(f'''
+        INSERT INTO students ({', '.join(app.STUDENT_COLUMNS)})
+        VALUES ({', '.join('?' * len(app.STUDENT_COLUMNS))})
+    ''', rows)
+    conn.commit()
+
+
+def legacy_dicts(conn):
+    # The representation get_students() returned before record types
+    students = []
+    for row in conn.execute(f"SELECT {', '.join(app.STUDENT_COLUMNS)} FROM students").fetchall():
+        students.append({
+            'student_id': row[0],
+            'name': row[1],
+            'age': row[2],
+            'email': row[3],
+            'phone': row[4],
+            'courses': json.loads(row[5]),
+            'registration_date': row[6],
+            'status': row[7],
+            'grades': json.loads(row[8]),
+            'progress': json.loads(row[9]),
+            'fees_paid': json.loads(row[10]),
+            'email_verified': bool(row[11]),
+            'campus': row[12]
+        })
+    return students
+
+
+def measure(build):
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if hasattr(result, 'memory_usage'):
+        # Arrow-backed string columns are allocated outside tracemalloc's view
+        current = max(current, int(result.memory_usage(deep=True).sum()))
+    del result
+    return current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory held by roster-sized get_students() results')
+    parser.add_argument('--students', type=int, default=50000)
+    args = parser.parse_args()
+
+    storage = app.SingleFileStorage(os.path.join(tempfile.mkdtemp(prefix='cre8learn_mem_'), 'cre8learn.db'))
+    populate(storage.primary, args.students)
+    manager = app.StudentManager(storage)
+
+    modes = [
+        ('dict per row (legacy)', lambda: legacy_dicts(storage.primary)),
+        ('StudentRecord', lambda: manager.get_students()),
+        ('DataFrame (as_frame)', lambda: manager.get_students(as_frame=True)),
+    ]
+    print(f"{args.students} students")
+    for label, build in modes:
+        current, peak = measure(build)
+        print(f"{label:24s} held {current / 2**20:7.1f} MiB ({current / args.students:6.0f} B/student)"
+              f"  peak {peak / 2**20:7.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
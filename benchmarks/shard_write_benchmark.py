@@ -0,0 +1,90 @@
+# Compare registration write throughput of the single-file and sharded backends.
+#
+#   python benchmarks/shard_write_benchmark.py --writers 4 --students 300
+#
+# Each writer registers students for its own campus. In the process mode every
+# writer is a separate process with its own connections (like one app server
+# per campus); in the thread mode the writers are threads sharing one storage
+# (like Streamlit sessions in one server) and also contend for the storage's
+# per-shard write locks. With the single-file backend every writer queues
+# behind the same database lock; with the sharded backend writers for
+# different campuses commit to different files in parallel.
+import argparse
+import os
+import sys
+import multiprocessing
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['CRE8LEARN_DATA_DIR'] = tempfile.mkdtemp(prefix='cre8learn_bench_')
+
+import app  # noqa: E402
+
+
+def writer(make_storage, campuses, index, count, ready):
+    manager = app.StudentManager(make_storage())
+    ready.wait()
+    for n in range(count):
+        manager.add_student(
+            f"Student {index}-{n}", 20, f"s{index}_{n}@bench.cre8learn.com",
+            "+266 5555 0000", ["Computer Hardware Basics"], campuses[index]
+        )
+
+
+def run(backend, writers, students_per_writer, shards, mode='process'):
+    data_dir = tempfile.mkdtemp(prefix=f'cre8learn_{backend}_')
+    if backend == 'sharded':
+        make_storage = lambda: app.ShardedStorage(num_shards=shards, data_dir=data_dir)
+    else:
+        make_storage = lambda: app.SingleFileStorage(os.path.join(data_dir, 'cre8learn.db'))
+
+    campuses = [f"Campus {i}" for i in range(writers)]
+    setup = make_storage()
+    for campus in campuses:
+        setup.shard_index(campus)
+
+    if mode == 'thread':
+        ready = threading.Barrier(writers + 1)
+        workers = [
+            threading.Thread(target=writer, args=(lambda: setup, campuses, i, students_per_writer, ready))
+            for i in range(writers)
+        ]
+    else:
+        # fork so the storage factory closures do not need to be picklable
+        ctx = multiprocessing.get_context('fork')
+        ready = ctx.Barrier(writers + 1)
+        workers = [
+            ctx.Process(target=writer, args=(make_storage, campuses, i, students_per_writer, ready))
+            for i in range(writers)
+        ]
+    for worker in workers:
+        worker.start()
+    ready.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    return writers * students_per_writer / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Single-file vs sharded write throughput')
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--students', type=int, default=300, help='students registered per writer')
+    args = parser.parse_args()
+
+    for mode in ('process', 'thread'):
+        print(f"one writer {mode} per campus")
+        baseline = run('single', args.writers, args.students, 1, mode)
+        print(f"  single file        : {baseline:8.0f} registrations/s")
+        for shards in (2, 4, 8):
+            if shards > args.writers:
+                break
+            throughput = run('sharded', args.writers, args.students, shards, mode)
+            print(f"  sharded ({shards} shards) : {throughput:8.0f} registrations/s  ({throughput / baseline:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
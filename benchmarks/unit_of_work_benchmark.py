@@ -0,0 +1,105 @@
+# Count commits (and time) for the registration and grading flows with and
+# without a unit of work.
+#
+#   python benchmarks/unit_of_work_benchmark.py --students 500
+#
+# "per call" is how the flows ran before: every manager method committed on
+# its own, and registration ran a separate email_verified UPDATE + commit.
+# "unit of work" wraps each flow in storage.unit_of_work(), and "batch" grades
+# a whole class in one block. Commits are counted from the COMMIT statements
+# SQLite actually executes.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['CRE8LEARN_DATA_DIR'] = tempfile.mkdtemp(prefix='cre8learn_bench_')
+
+import app  # noqa: E402
+
+COURSE = "Computer Hardware Basics"
+QUIZ_ID = "quiz_bench"
+
+
+def make_storage(backend):
+    data_dir = tempfile.mkdtemp(prefix=f'cre8learn_uow_{backend}_')
+    if backend == 'sharded':
+        return app.ShardedStorage(data_dir=data_dir)
+    return app.SingleFileStorage(os.path.join(data_dir, 'cre8learn.db'))
+
+
+def count_commits(storage):
+    commits = []
+    for conn in storage.connections():
+        conn.set_trace_callback(lambda sql: commits.append(1) if sql.lstrip().upper().startswith('COMMIT') else None)
+    return commits
+
+
+def register_per_call(manager, n):
+    student_id = manager.add_student(f"Student {n}", 20, f"s{n}@bench.cre8learn.com", "+266 5555 0000", [COURSE])
+    conn = manager.storage.conn_for_student(student_id)
+    conn.execute("UPDATE students SET email_verified = TRUE WHERE student_id = ?", (student_id,))
+    conn.commit()
+    return student_id
+
+
+def register_unit_of_work(manager, n):
+    with manager.storage.unit_of_work():
+        student_id = manager.add_student(f"Student {n}", 20, f"s{n}@bench.cre8learn.com", "+266 5555 0000", [COURSE])
+        manager.mark_email_verified(student_id)
+    return student_id
+
+
+def grade(student_manager, quiz_manager, student_id):
+    score = random.randint(0, 10)
+    quiz_manager.save_quiz_result(QUIZ_ID, student_id, score, 10, {})
+    student_manager.update_student_progress(student_id, COURSE, '100%', grade=f"{score * 10}%")
+
+
+def run(backend, mode, students):
+    storage = make_storage(backend)
+    student_manager = app.StudentManager(storage)
+    quiz_manager = app.QuizManager(storage)
+    quiz_manager.create_quiz(QUIZ_ID, "Benchmark quiz", COURSE, 30, [])
+    commits = count_commits(storage)
+
+    register = register_unit_of_work if mode != 'per call' else register_per_call
+    start = time.perf_counter()
+    student_ids = [register(student_manager, n) for n in range(students)]
+    register_time, register_commits = time.perf_counter() - start, len(commits)
+
+    commits.clear()
+    start = time.perf_counter()
+    if mode == 'per call':
+        for student_id in student_ids:
+            grade(student_manager, quiz_manager, student_id)
+    elif mode == 'unit of work':
+        for student_id in student_ids:
+            with storage.unit_of_work():
+                grade(student_manager, quiz_manager, student_id)
+    else:
+        with storage.unit_of_work():
+            for student_id in student_ids:
+                grade(student_manager, quiz_manager, student_id)
+    return register_commits, register_time, len(commits), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Commits per flow with and without a unit of work')
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--backend', choices=['single', 'sharded'], default='single')
+    args = parser.parse_args()
+
+    print(f"{args.students} registrations and quiz gradings ({args.backend})")
+    print(f"{'mode':14s} {'register commits':>17s} {'reg/s':>8s} {'grade commits':>14s} {'grades/s':>9s}")
+    for mode in ('per call', 'unit of work', 'batch'):
+        register_commits, register_time, grade_commits, grade_time = run(args.backend, mode, args.students)
+        print(f"{mode:14s} {register_commits:17d} {args.students / register_time:8.0f} "
+              f"{grade_commits:14d} {args.students / grade_time:9.0f}")
+
+
+if __name__ == '__main__':
+    main()